@@ -0,0 +1,54 @@
+"""Bulk DataLoader against AsyncLoader at several concurrency levels, with an artificial
+network latency added to every statement. Needs the database from .env, it WIPES the loaded tables.
+
+    DB_POOL_SIZE=9 python -m benchmarks.bench_async_loader --rows 50000 --latency-ms 5 --concurrency 1 2 4 8
+"""
+import argparse
+import time
+from src.database import db, initialize_database, POOL_SIZE
+from src.loader import AsyncLoader, DataLoader
+from src.processor import DataProcessor
+from src.rejects import DroppedRecords
+from benchmarks.bench_workers import synthetic_sheet
+
+def inject_latency(seconds):
+    execute_sql = db.execute_sql
+
+    def delayed(*args, **kwargs):
+        time.sleep(seconds)
+        return execute_sql(*args, **kwargs)
+
+    db.execute_sql = delayed
+
+def timed_load(loader, clients, contracts):
+    loader.clean_previous_data()
+    start = time.perf_counter()
+    stats = loader.load_data(clients, contracts, DroppedRecords())
+    return time.perf_counter() - start, stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    if max(args.concurrency) >= POOL_SIZE:
+        parser.error(f"--concurrency {max(args.concurrency)} needs DB_POOL_SIZE of at least {max(args.concurrency) + 1}")
+
+    processor = DataProcessor()
+    df = processor.preprocess_frame(synthetic_sheet(args.rows))
+    clients = processor.extract_clients(df)
+    contracts = processor.extract_contracts(df, clients)
+
+    db_data = initialize_database()
+    inject_latency(args.latency_ms / 1000)
+    print(f"{len(clients):,} clients, {len(contracts):,} contracts, {args.latency_ms}ms per statement")
+
+    elapsed, _ = timed_load(DataLoader(db_data, bulk=True, batch_size=args.batch_size), clients, contracts)
+    print(f"{'bulk':>16}: {elapsed:8.2f}s")
+    for concurrency in args.concurrency:
+        loader = AsyncLoader(db_data, batch_size=args.batch_size, concurrency=concurrency)
+        elapsed_async, stats = timed_load(loader, clients, contracts)
+        assert stats["contracts_inserted"] == len(contracts)
+        print(f"{f'async x{concurrency}':>16}: {elapsed_async:8.2f}s  {elapsed / elapsed_async:5.2f}x")
@@ -0,0 +1,57 @@
+"""Compare the per-string check_cpf (through Series.apply) with the vectorized validator.
+
+    python -m benchmarks.bench_cpf --rows 1000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from src.helpers import check_cpf, validate_cpf_cnpj, _cpf_check_digits, _cnpj_check_digits
+
+def synthetic_documents(rows, cnpj_ratio=0.2, invalid_ratio=0.1, seed=42):
+    """Formatted CPFs and CNPJs with correct check digits, except for invalid_ratio of them"""
+    rng = np.random.default_rng(seed)
+    is_cnpj = rng.random(rows) < cnpj_ratio
+    documents = pd.Series(index=range(rows), dtype=object)
+
+    for size, check, mask in ((11, _cpf_check_digits, ~is_cnpj), (14, _cnpj_check_digits, is_cnpj)):
+        matrix = rng.integers(0, 10, size=(int(mask.sum()), size)).astype(np.int8)
+        matrix[:, -2] = check(matrix)[0]
+        matrix[:, -1] = check(matrix)[1]
+        broken = rng.random(len(matrix)) < invalid_ratio
+        matrix[broken, -1] = (matrix[broken, -1] + 1) % 10
+
+        digits = pd.Series((matrix + ord('0')).astype(np.uint8).view(f"S{size}").ravel()).str.decode('ascii')
+        if size == 11:
+            formatted = digits.str[:3] + '.' + digits.str[3:6] + '.' + digits.str[6:9] + '-' + digits.str[9:]
+        else:
+            formatted = (digits.str[:2] + '.' + digits.str[2:5] + '.' + digits.str[5:8] + '/'
+                         + digits.str[8:12] + '-' + digits.str[12:])
+        documents[mask] = formatted.to_numpy()
+
+    return documents
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    documents = synthetic_documents(args.rows)
+    cpfs = documents[documents.str.len() == 14]
+
+    old_mask, old_time = timed(lambda s: s.astype(str).apply(check_cpf), cpfs)
+    (new_mask, _), new_time = timed(validate_cpf_cnpj, cpfs)
+    assert old_mask.equals(new_mask), "vectorized validator disagrees with check_cpf"
+
+    (all_mask, _), all_time = timed(validate_cpf_cnpj, documents)
+
+    print(f"rows: {len(cpfs)} CPFs, {len(documents)} CPFs + CNPJs ({all_mask.mean():.1%} valid)")
+    print(f"apply(check_cpf):        {old_time:8.3f}s  {len(cpfs) / old_time:12,.0f} rows/s")
+    print(f"validate_cpf_cnpj (CPF): {new_time:8.3f}s  {len(cpfs) / new_time:12,.0f} rows/s")
+    print(f"validate_cpf_cnpj (all): {all_time:8.3f}s  {len(documents) / all_time:12,.0f} rows/s")
+    print(f"speedup: {old_time / new_time:.1f}x")
@@ -0,0 +1,83 @@
+"""Load time and viewer latency without the indexes of migration 3, with them maintained
+during the load, and with them deferred (dropped and rebuilt) around the load.
+Needs the database from .env, it WIPES the loaded tables and leaves the indexes in place.
+
+    python -m benchmarks.bench_indexes --rows 200000
+"""
+import argparse
+import statistics
+import time
+from src.database import db, initialize_database
+from src.loader import DataLoader
+from src.migrations import MIGRATIONS, deferred_indexes
+from src.processor import DataProcessor
+from src.rejects import DroppedRecords
+from src.view import contract_counts, contracts_query, iter_server_side
+from benchmarks.generate import generate_sheet
+
+INDEX_STATEMENTS = dict((version, statements) for version, _, statements in MIGRATIONS)[3]
+INDEX_NAMES = [sql.split(" IF NOT EXISTS ")[1].split()[0] for sql in INDEX_STATEMENTS]
+TABLES = ("tbl_clientes", "tbl_cliente_contatos", "tbl_cliente_contratos")
+
+def set_indexes(present):
+    for sql, name in zip(INDEX_STATEMENTS, INDEX_NAMES):
+        db.execute_sql(sql if present else f"DROP INDEX IF EXISTS {name}")
+
+def timed_load(db_data, batch_size, clients, contracts, defer):
+    loader = DataLoader(db_data, bulk=True, batch_size=batch_size)
+    loader.clean_previous_data()
+    start = time.perf_counter()
+    if defer:
+        with deferred_indexes(db, TABLES):
+            loader.load_data(clients, contracts, DroppedRecords())
+    else:
+        loader.load_data(clients, contracts, DroppedRecords())
+        for table in TABLES:
+            db.execute_sql(f"ANALYZE {table}")
+    return time.perf_counter() - start
+
+def view_latencies(cpf_cnpj, repeat):
+    queries = {
+        "page by uf+status": lambda: list(iter_server_side(contracts_query(uf="SP", status="Ativo").limit(20))),
+        "page by cpf/cnpj": lambda: list(iter_server_side(contracts_query(cpf_cnpj=cpf_cnpj).limit(20))),
+        "count by city": lambda: contract_counts(exact=True, city="Gomes"),
+        "exempt count": lambda: db.execute_sql(
+            "SELECT count(*) FROM tbl_cliente_contratos WHERE isento").fetchone(),
+        "deep page (after id)": lambda: list(iter_server_side(
+            contracts_query(after_id=max_id // 2, status="Cancelado").limit(20)))
+    }
+    results = {}
+    for label, query in queries.items():
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            times.append(time.perf_counter() - start)
+        results[label] = statistics.median(times)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    db_data = initialize_database()
+    processor = DataProcessor()
+    df = processor.preprocess_frame(generate_sheet(args.rows))
+    clients = processor.extract_clients(df)
+    contracts = processor.extract_contracts(df, clients)
+
+    scenarios = (("no indexes", False, False), ("indexes kept", True, False), ("indexes deferred", True, True))
+    rows = []
+    for label, present, defer in scenarios:
+        set_indexes(present)
+        load_time = timed_load(db_data, args.batch_size, clients, contracts, defer)
+        max_id = db.execute_sql("SELECT max(id) FROM tbl_cliente_contratos").fetchone()[0]
+        rows.append((label, load_time, view_latencies(clients[0].cpf_cnpj, args.repeat)))
+
+    views = list(rows[0][2])
+    print(f"{'':>18} {'load s':>8} " + " ".join(f"{v:>20}" for v in views))
+    for label, load_time, latencies in rows:
+        print(f"{label:>18} {load_time:8.2f} " + " ".join(f"{latencies[v] * 1000:18.2f}ms" for v in views))
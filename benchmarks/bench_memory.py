@@ -0,0 +1,65 @@
+"""Bytes per sheet row held by the records DataProcessor hands to the loaders,
+with the previous dict-based representation ("before") and the slotted records ("after").
+Rejected rows are kept whole before, and only as counters and a sample after.
+
+    python -m benchmarks.bench_memory --rows 1000000
+"""
+import argparse
+import sys
+from src.processor import DataProcessor
+from src.records import Record
+from src.rejects import ListRejectSink
+from benchmarks.bench_workers import synthetic_sheet
+
+def deep_size(obj, seen):
+    """Size of obj and everything it references, counting shared objects once"""
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_size(v, seen) for v in obj)
+    elif isinstance(obj, Record):
+        size += sum(deep_size(getattr(obj, field), seen) for field in obj.__slots__)
+    return size
+
+def as_dicts(clients, contracts, rejects, raw):
+    """The same data shaped like the previous nested dicts, with full row copies for rejects"""
+    clients = [{**c.as_dict(), "contatos": [ct.as_dict() for ct in c.contatos]} for c in clients]
+    contracts = [
+        {
+            **{k: v for k, v in c.as_dict().items() if not k.startswith("plano_")},
+            "plano": {"descricao": c.plano_descricao, "valor": c.plano_valor}
+        }
+        for c in contracts
+    ]
+    dropped = {}
+    for category, r in rejects:
+        if r.row is not None:
+            dropped.setdefault(category, []).append({"reason": r.reason, "data": raw.loc[r.row].to_dict()})
+    return clients, contracts, dropped
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    raw = synthetic_sheet(args.rows)
+    rejects = ListRejectSink()
+    processor = DataProcessor(rejects)
+    df = processor.preprocess_frame(raw)
+    clients = processor.extract_clients(df)
+    contracts = processor.extract_contracts(df, clients)
+    del df
+
+    processor.dropped_records.flush()
+    dropped = processor.dropped_records
+    after = deep_size((clients, contracts, dropped.counts, dropped.samples), set())
+    before = deep_size(as_dicts(clients, contracts, rejects.records, raw), set())
+
+    print(f"rows: {args.rows:,} ({len(clients):,} clients, {len(contracts):,} contracts)")
+    print(f"before (dicts):  {before / args.rows:8.0f} bytes/row  {before / 2**20:10.1f} MiB")
+    print(f"after (records): {after / args.rows:8.0f} bytes/row  {after / 2**20:10.1f} MiB")
+    print(f"saved: {1 - after / before:.0%}")
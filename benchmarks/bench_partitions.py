@@ -0,0 +1,41 @@
+"""Scaling of PartitionedLoader with the number of hash partitions, against the single connection
+bulk DataLoader. --latency-ms adds a delay to every statement, like a database across the network.
+Needs the database from .env, it WIPES the loaded tables.
+
+    DB_POOL_SIZE=9 python -m benchmarks.bench_partitions --rows 200000 --partitions 1 2 4 8
+"""
+import argparse
+from src.database import initialize_database, POOL_SIZE
+from src.loader import DataLoader, PartitionedLoader
+from src.processor import DataProcessor
+from benchmarks.bench_async_loader import inject_latency, timed_load
+from benchmarks.generate import generate_sheet
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--partitions", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+    if max(args.partitions) >= POOL_SIZE:
+        parser.error(f"--partitions {max(args.partitions)} needs DB_POOL_SIZE of at least {max(args.partitions) + 1}")
+
+    processor = DataProcessor()
+    df = processor.preprocess_frame(generate_sheet(args.rows))
+    clients = processor.extract_clients(df)
+    contracts = processor.extract_contracts(df, clients)
+
+    db_data = initialize_database()
+    if args.latency_ms:
+        inject_latency(args.latency_ms / 1000)
+    print(f"{len(clients):,} clients, {len(contracts):,} contracts, {args.latency_ms}ms per statement")
+
+    baseline, _ = timed_load(DataLoader(db_data, bulk=True, batch_size=args.batch_size), clients, contracts)
+    print(f"{'bulk':>16}: {baseline:8.2f}s  {len(contracts) / baseline:10,.0f} contracts/s")
+    for partitions in args.partitions:
+        loader = PartitionedLoader(db_data, batch_size=args.batch_size, partitions=partitions)
+        elapsed, stats = timed_load(loader, clients, contracts)
+        assert stats["contracts_inserted"] == len(contracts)
+        print(f"{f'partitions x{partitions}':>16}: {elapsed:8.2f}s  {len(contracts) / elapsed:10,.0f} contracts/s"
+              f"  {baseline / elapsed:5.2f}x")
@@ -0,0 +1,145 @@
+"""Latency of main.py search over a synthetic dataset, against a plain ILIKE scan of the same
+names. Rows are generated by the database itself (generate_series), a multi-million client
+dataset takes a few minutes instead of hours through the sheet pipeline.
+Needs the database from .env with migration 8 applied, it WIPES the loaded tables.
+
+    python -m benchmarks.bench_search --clients 2000000
+    python -m benchmarks.bench_search --reuse          # time the data generated by the last run
+"""
+import argparse
+import statistics
+import time
+from src.database import db, initialize_database
+from src.loader import DataLoader
+from src.migrations import deferred_indexes
+from src.search import search_clients
+from benchmarks.generate import FIRST_NAMES, SURNAMES, PLANS, STATUSES, DUE_DAYS
+
+TABLES = ("tbl_clientes", "tbl_cliente_contatos", "tbl_cliente_contratos")
+ACCENTS = ("áàãâéêíóôõúç", "aaaaeeiooouc")
+
+CLIENTS_SQL = """
+    INSERT INTO tbl_clientes (nome_razao_social, nome_fantasia, cpf_cnpj, data_cadastro)
+    SELECT
+        nome || CASE WHEN empresa THEN ' Ltda' ELSE '' END,
+        CASE WHEN empresa THEN nome END,
+        CASE WHEN empresa
+            THEN regexp_replace(lpad((i * 2654435761 %% 100000000000000)::text, 14, '0'),
+                                '(\\d{2})(\\d{3})(\\d{3})(\\d{4})(\\d{2})', '\\1.\\2.\\3/\\4-\\5')
+            ELSE regexp_replace(lpad((i * 2654435761 %% 100000000000)::text, 11, '0'),
+                                '(\\d{3})(\\d{3})(\\d{3})(\\d{2})', '\\1.\\2.\\3-\\4')
+        END,
+        now() - (i %% 3650) * interval '1 day'
+    FROM (
+        SELECT i, i %% 20 = 0 AS empresa,
+            (%(first)s::text[])[1 + i * 31 %% %(n_first)s] || ' ' ||
+            (%(surnames)s::text[])[1 + i / %(n_first)s %% %(n_surnames)s] || ' ' ||
+            (%(surnames)s::text[])[1 + (i * 7 + 3) %% %(n_surnames)s] AS nome
+        FROM generate_series(%(start)s::bigint, %(stop)s::bigint) i
+    ) g
+"""
+CONTACTS_SQL = """
+    INSERT INTO tbl_cliente_contatos (cliente_id, tipo_contato_id, contato)
+    SELECT c.id, t.id, CASE t.tipo_contato
+        WHEN 'Celular' THEN '55' || (11 + c.id %% 89) || '9' || lpad((c.id * 48271 %% 100000000)::text, 8, '0')
+        ELSE translate(lower(replace(split_part(c.nome_razao_social, ' ', 1) || '.' ||
+                                     split_part(c.nome_razao_social, ' ', 2), ' ', '')),
+                       %(accents)s, %(plain)s) || c.id || '@example.com'
+        END
+    FROM tbl_clientes c
+    JOIN tbl_tipos_contato t ON t.tipo_contato IN ('Celular', 'E-Mail')
+"""
+CONTRACTS_SQL = """
+    INSERT INTO tbl_cliente_contratos (cliente_id, plano_id, dia_vencimento, endereco_logradouro,
+        endereco_numero, endereco_bairro, endereco_cidade, endereco_cep, endereco_uf, status_id)
+    SELECT c.id, (%(plans)s::int[])[1 + c.id %% %(n_plans)s], (%(days)s::int[])[1 + c.id %% %(n_days)s],
+        'Rua Trinta', (c.id %% 999)::text, 'Centro', 'Cidade ' || c.id %% 500,
+        lpad((c.id %% 100000000)::text, 8, '0'), (%(ufs)s::text[])[1 + c.id %% 27],
+        (%(statuses)s::int[])[1 + c.id %% %(n_statuses)s]
+    FROM tbl_clientes c
+"""
+UFS = ["AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG", "PA", "PB",
+       "PR", "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO"]
+
+# Without the indexes of migration 8 every name is read: ranking needs all the matches
+BASELINE_SQL = """
+    SELECT count(*) FROM tbl_clientes
+    WHERE nome_razao_social ILIKE %s OR nome_fantasia ILIKE %s
+"""
+
+def generate(db_data, clients, batch_size):
+    DataLoader(db_data).clean_previous_data()
+    for description, value in PLANS.items():
+        db.execute_sql("INSERT INTO tbl_planos (descricao, valor) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                       (description, value))
+    plans = [row[0] for row in db.execute_sql("SELECT id FROM tbl_planos WHERE descricao = ANY(%s)", (list(PLANS),))]
+    statuses = [row[0] for row in db.execute_sql(
+        "SELECT id FROM tbl_status_contrato WHERE status = ANY(%s)", (STATUSES,))]
+    params = {
+        "first": FIRST_NAMES, "n_first": len(FIRST_NAMES), "surnames": SURNAMES, "n_surnames": len(SURNAMES),
+        "accents": ACCENTS[0], "plain": ACCENTS[1], "plans": plans, "n_plans": len(plans),
+        "days": DUE_DAYS, "n_days": len(DUE_DAYS), "ufs": UFS, "statuses": statuses, "n_statuses": len(statuses)
+    }
+    start = time.perf_counter()
+    with deferred_indexes(db, TABLES):
+        for first in range(1, clients + 1, batch_size):
+            db.execute_sql(CLIENTS_SQL, {**params, "start": first, "stop": min(first + batch_size - 1, clients)})
+        db.execute_sql(CONTACTS_SQL, params)
+        db.execute_sql(CONTRACTS_SQL, params)
+    print(f"Generated {clients:,} clients in {time.perf_counter() - start:.1f}s (indexes rebuilt)")
+
+def sample_queries():
+    """Queries that hit existing rows: names with and without accents, a typo, and fragments
+    of a CPF, a phone and an e-mail taken from the data"""
+    cpf, phone, email = db.execute_sql("""
+        SELECT c.cpf_cnpj, cel.contato, mail.contato
+        FROM tbl_clientes c
+        JOIN tbl_cliente_contatos cel ON cel.cliente_id = c.id AND cel.contato ~ '^\\d+$'
+        JOIN tbl_cliente_contatos mail ON mail.cliente_id = c.id AND mail.contato LIKE '%%@%%'
+        ORDER BY c.id OFFSET (SELECT count(*) / 2 FROM tbl_clientes) LIMIT 1
+    """).fetchone()
+    return {
+        "name with accents": "Otávio Gonçalves",
+        "name without accents": "otavio goncalves",
+        "name with a typo": "Patrícia Teixera",
+        "single word": "Monteiro",
+        "cpf/cnpj prefix": cpf[:7],
+        "phone fragment": phone[-8:],
+        "e-mail": email.split("@")[0]
+    }
+
+def timings(query, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        query()
+        times.append(time.perf_counter() - start)
+    return times
+
+def percentile(times, q):
+    return statistics.quantiles(times, n=100)[q - 1] if len(times) > 1 else times[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=500_000, help="Clients generated per statement")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--baseline-repeat", type=int, default=3)
+    parser.add_argument("--reuse", action="store_true", help="Time the rows already in the database")
+    args = parser.parse_args()
+
+    db_data = initialize_database()
+    if not args.reuse:
+        generate(db_data, args.clients, args.batch_size)
+    total = db.execute_sql("SELECT count(*) FROM tbl_clientes").fetchone()[0]
+    print(f"{total:,} clients\n")
+
+    print(f"{'query':>22} {'results':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for label, query in sample_queries().items():
+        found = len(search_clients(query))
+        times = timings(lambda: search_clients(query), args.repeat)
+        print(f"{label:>22} {found:8d} {percentile(times, 50) * 1000:9.2f} {percentile(times, 95) * 1000:9.2f}")
+
+    pattern = "%Gonçalves%"
+    times = timings(lambda: db.execute_sql(BASELINE_SQL, (pattern, pattern)).fetchall(), args.baseline_repeat)
+    print(f"\n{'ILIKE scan baseline':>22} {'':>8} {statistics.median(times) * 1000:9.2f}")
@@ -0,0 +1,63 @@
+"""Import cost of the CLI paths that never read a sheet, each one in a fresh interpreter under
+`python -X importtime`. Exits with 1 when a path imports one of the heavy modules kept out of it
+or its import time goes over its budget, so it can guard against startup regressions.
+The budgets are about twice what these paths take on a laptop, --budget-ms overrides them.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --budget-ms 400
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Interpreter arguments and import budget in ms of each path, run from the repository root.
+# The view path is what main.py imports for view and dashboard, without the database round trips
+PATHS = {
+    "main.py --help": (["main.py", "--help"], 250),
+    "view": (["-c", "import main; from src.view import view_contracts, view_dashboard"], 350)
+}
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow")
+
+def import_times(argv):
+    """Cumulative import time in ms of each top-level import of argv, and every module imported"""
+    result = subprocess.run([sys.executable, "-X", "importtime", *argv], capture_output=True, text=True, check=True)
+    top_level, modules = {}, set()
+    for line in result.stderr.splitlines():
+        # import time:       679 |     470682 | pandas   (nested imports are indented)
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        modules.add(name.strip())
+        if not name[1:].startswith(" "):
+            top_level[name.strip()] = int(cumulative) / 1000
+    return top_level, modules
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, help="Import time allowed to every path, instead of their own budgets")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per path, the median is compared")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports shown per path")
+    args = parser.parse_args()
+
+    failures = 0
+    for label, (argv, budget) in PATHS.items():
+        budget = args.budget_ms or budget
+        runs = [import_times(argv) for _ in range(args.repeat)]
+        total = statistics.median(sum(top_level.values()) for top_level, _ in runs)
+        top_level, modules = runs[-1]
+        heavy = sorted(m for m in modules if m in HEAVY_MODULES)
+
+        problems = []
+        if total > budget:
+            problems.append(f"over the {budget:g}ms budget")
+        if heavy:
+            problems.append(f"imports {', '.join(heavy)}")
+        failures += bool(problems)
+
+        print(f"{label}: {total:.1f}ms {'FAIL, ' + ' and '.join(problems) if problems else 'ok'}")
+        for name, elapsed in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"  {elapsed:8.1f}ms  {name}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,53 @@
+"""UF column mapping: the previous per-row apply (dict rebuilt and text normalized on every
+call) against the memoized state_to_uf and the factorized states_to_uf.
+
+    python -m benchmarks.bench_uf --rows 1000000
+"""
+import argparse
+import time
+import unicodedata
+import numpy as np
+import pandas as pd
+from src.helpers import STATES_UF, _state_key, normalize_text, state_to_uf, states_to_uf
+from benchmarks.generate import STATES
+
+def legacy_state_to_uf(state):
+    states_uf = dict(STATES_UF)
+    state = ''.join(c for c in unicodedata.normalize('NFD', state.strip())
+                    if unicodedata.category(c) != 'Mn').lower()
+    if state not in states_uf:
+        raise ValueError(f"UF not found for state: {state.capitalize()}")
+    return states_uf[state]
+
+def synthetic_states(rows, seed=42):
+    """State names with the case and spacing variations of a typed sheet"""
+    rng = np.random.default_rng(seed)
+    names = pd.Series(np.asarray(STATES, dtype=object)[rng.integers(0, len(STATES), size=rows)])
+    variant = rng.integers(0, 4, size=rows)
+    names = names.where(variant != 1, names.str.upper())
+    names = names.where(variant != 2, names.str.lower())
+    return names.where(variant != 3, names + " ")
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    args = parser.parse_args()
+
+    states = synthetic_states(args.rows)
+    legacy, legacy_time = timed(lambda s: s.apply(legacy_state_to_uf), states)
+    normalize_text.cache_clear()
+    _state_key.cache_clear()
+    memoized, memoized_time = timed(lambda s: s.apply(state_to_uf), states)
+    _state_key.cache_clear()
+    factorized, factorized_time = timed(states_to_uf, states)
+    assert legacy.equals(memoized) and legacy.equals(factorized), "UF mappings disagree"
+
+    print(f"rows: {args.rows}, {states.nunique()} distinct spellings")
+    for label, elapsed in (("apply(legacy)", legacy_time), ("apply(memoized)", memoized_time),
+                           ("states_to_uf", factorized_time)):
+        print(f"{label:>16}: {elapsed:8.3f}s  {args.rows / elapsed:12,.0f} rows/s  {legacy_time / elapsed:6.1f}x")
@@ -0,0 +1,50 @@
+"""Scaling curve of DataProcessor.process_parallel against the sequential pre-processing.
+
+    python -m benchmarks.bench_workers --rows 500000 --workers 1 2 4 8 16
+"""
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from src.processor import DataProcessor
+from benchmarks.bench_cpf import synthetic_documents
+
+def synthetic_sheet(rows, sample="data/sheet.xlsx", seed=42):
+    """The sample sheet repeated up to rows, with fresh CPF/CNPJs (about 5% repeated)"""
+    base = pd.read_excel(sample)
+    rng = np.random.default_rng(seed)
+    df = base.iloc[rng.integers(0, len(base), size=rows)].reset_index(drop=True)
+    documents = synthetic_documents(rows, seed=seed)
+    repeated = rng.random(rows) < 0.05
+    documents[repeated] = documents.iloc[rng.integers(0, rows, size=int(repeated.sum()))].to_numpy()
+    df["CPF/CNPJ"] = documents
+    return df
+
+def sequential(df):
+    processor = DataProcessor()
+    processed = processor.preprocess_frame(df)
+    clients = processor.extract_clients(processed)
+    processor.extract_contracts(processed, clients)
+
+def parallel(df, workers):
+    DataProcessor().process_parallel(df, workers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, os.cpu_count()])
+    args = parser.parse_args()
+
+    df = synthetic_sheet(args.rows)
+
+    start = time.perf_counter()
+    sequential(df)
+    baseline = time.perf_counter() - start
+    print(f"{'sequential':>12}: {baseline:8.2f}s  {args.rows / baseline:10,.0f} rows/s")
+
+    for workers in sorted(set(args.workers)):
+        start = time.perf_counter()
+        parallel(df, workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>4} workers: {elapsed:8.2f}s  {args.rows / elapsed:10,.0f} rows/s  {baseline / elapsed:5.2f}x")
@@ -0,0 +1,154 @@
+"""Synthetic import sheets in the layout DataProcessor expects, at any volume.
+
+    python -m benchmarks.generate --rows 1000000 --out /tmp/sheet_1m.csv --duplicate-ratio 0.05
+"""
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from benchmarks.bench_cpf import synthetic_documents
+
+# xlsx sheets stop at 1,048,576 rows, header included
+XLSX_MAX_ROWS = 1_048_575
+
+REQUIRED_COLUMNS = [
+    "Nome/Razão Social", "CPF/CNPJ", "Data Cadastro cliente", "Vencimento", "Endereço",
+    "Bairro", "Cidade", "CEP", "UF", "Status", "Plano Valor", "Plano"
+]
+
+FIRST_NAMES = [
+    "Ana", "Antonio", "Beatriz", "Bruno", "Camila", "Carlos", "Daniela", "Eduardo", "Fernanda",
+    "Gabriel", "Helena", "Henrique", "Isabela", "João", "Julia", "Lucas", "Mariana", "Nicolas",
+    "Otávio", "Patrícia", "Rafael", "Sofia", "Thiago", "Vitória"
+]
+SURNAMES = [
+    "Almeida", "Barbosa", "Cardoso", "Costa", "Cunha", "da Luz", "da Mata", "Ferreira", "Gomes",
+    "Gonçalves", "Melo", "Monteiro", "Novaes", "Nunes", "Oliveira", "Pereira", "Ribeiro", "Rocha",
+    "Santos", "Silva", "Souza", "Teixeira"
+]
+COMPANY_SUFFIXES = ["Ltda", "S.A.", "ME", "EIRELI", "Comércio", "Serviços"]
+STREETS = ["Rua Trinta", "Rua Trinta e Dois", "Avenida Brasil", "Rua das Flores", "Travessa Sete",
+           "Alameda Santos", "Rua Quinze de Novembro", "Avenida Paulista"]
+NEIGHBOURHOODS = ["Nazare", "Caiçaras", "Centro", "Boa Vista", "Jardim América", "Santa Efigênia",
+                  "Vila Nova", "São Bento"]
+STATES = [
+    "Acre", "Alagoas", "Amapá", "Amazonas", "Bahia", "Ceará", "Distrito Federal", "Espírito Santo",
+    "Goiás", "Maranhão", "Mato Grosso", "Mato Grosso do Sul", "Minas Gerais", "Pará", "Paraíba",
+    "Paraná", "Pernambuco", "Piauí", "Rio de Janeiro", "Rio Grande do Norte", "Rio Grande do Sul",
+    "Rondônia", "Roraima", "Santa Catarina", "São Paulo", "Sergipe", "Tocantins"
+]
+# Plano.descricao is unique, so every description keeps a single price
+PLANS = {
+    "10_MEGA_GB_89_NOVO": 89.9, "25_MEGA_GB_109_NOVO": 109.9, "50MB_PLA_ITA_FIBRA_99_NOVO": 99.9,
+    "100MB_FIBRA_ITA_119_NOVO": 119.9, "300MB_PLANO_ITA_F_139_NOVO": 139.9, "500MB_FIBRA_159_NOVO": 159.9,
+    "1GB_FIBRA_199_NOVO": 199.9, "100MB_FIBRA_119,90_ANT": 119.9
+}
+# Must exist in tbl_status_contrato
+STATUSES = ["Ativo", "Velocidade Reduzida", "Suspenso", "Cancelado"]
+DUE_DAYS = [5, 10, 15, 20, 25]
+
+def generate_sheet(rows, duplicate_ratio=0.05, invalid_cpf_ratio=0.01, missing_ratio=0.01,
+                   contact_density=0.8, cnpj_ratio=0.2, seed=42):
+    """DataFrame shaped like the import sheet.
+
+    duplicate_ratio of the rows reuse the CPF/CNPJ of another row, invalid_cpf_ratio have a
+    wrong check digit, missing_ratio lack one required value and contact_density is the
+    chance of each contact column (mobile, phone, e-mail) being filled"""
+    rng = np.random.default_rng(seed)
+
+    def pick(values):
+        return np.asarray(values, dtype=object)[rng.integers(0, len(values), size=rows)]
+
+    documents = synthetic_documents(rows, cnpj_ratio=cnpj_ratio, invalid_ratio=invalid_cpf_ratio, seed=seed)
+    repeated = rng.random(rows) < duplicate_ratio
+    documents[repeated] = documents.iloc[rng.integers(0, rows, size=int(repeated.sum()))].to_numpy()
+    is_company = (documents.str.len() == 18).to_numpy()
+
+    first, last = pick(FIRST_NAMES), pick(SURNAMES)
+    people = pd.Series(first) + " " + pd.Series(last)
+    companies = pd.Series(last) + " " + pd.Series(pick(COMPANY_SUFFIXES))
+    names = people.where(~is_company, companies)
+    emails = (pd.Series(first).str.lower() + "." + pd.Series(last).str.lower().str.replace(" ", "")
+              + pd.Series(rng.integers(1, 1000, size=rows)).astype(str) + "@example.com.br")
+
+    plans = pick(list(PLANS))
+    df = pd.DataFrame({
+        "Nome/Razão Social": names,
+        "Nome Fantasia": companies.where(is_company & (rng.random(rows) < 0.5), None),
+        "CPF/CNPJ": documents,
+        "Data Nasc.": pd.Series(_random_dates(rng, rows, "1950-01-01", "2005-12-31")).where(~is_company),
+        "Data Cadastro cliente": _random_dates(rng, rows, "2015-01-01", "2024-12-31"),
+        "Celulares": _phones(rng, rows, 9, contact_density),
+        "Telefones": _phones(rng, rows, 8, contact_density),
+        "Emails": emails.where(rng.random(rows) < contact_density, None),
+        "Endereço": pick(STREETS),
+        "Número": rng.integers(1, 3000, size=rows).astype(str),
+        "Complemento": pd.Series("lote " + pd.Series(rng.integers(1, 50, size=rows)).astype(str)
+                                 ).where(rng.random(rows) < 0.4, None),
+        "Bairro": pick(NEIGHBOURHOODS),
+        "CEP": _ceps(rng, rows),
+        "Cidade": pick(SURNAMES),
+        "UF": pick(STATES),
+        "Plano": plans,
+        "Plano Valor": pd.Series(plans).map(PLANS).to_numpy(),
+        "Vencimento": pd.array(pick(DUE_DAYS).astype(int), dtype="Int64"),
+        "Status": pick(STATUSES),
+        "Isento": np.where(rng.random(rows) < 0.01, "Sim", None)
+    })
+
+    missing = np.flatnonzero(rng.random(rows) < missing_ratio)
+    columns = rng.integers(0, len(REQUIRED_COLUMNS), size=len(missing))
+    for col_idx, col in enumerate(REQUIRED_COLUMNS):
+        df.loc[missing[columns == col_idx], col] = None
+    return df
+
+def _random_dates(rng, rows, start, end):
+    start, end = pd.Timestamp(start).value // 10**9, pd.Timestamp(end).value // 10**9
+    seconds = rng.integers(start, end, size=rows)
+    return pd.to_datetime(seconds - seconds % 86400, unit="s")
+
+def _phones(rng, rows, digits, density):
+    # Read from the sample sheet as floats, like 5511483992889.0
+    area = rng.integers(11, 100, size=rows)
+    number = rng.integers(10 ** (digits - 1), 10 ** digits, size=rows)
+    phones = (55 * 100 + area) * 10 ** digits + number
+    return np.where(rng.random(rows) < density, phones.astype(float), np.nan)
+
+def _ceps(rng, rows):
+    digits = pd.Series(rng.integers(1_000_000, 99_999_999, size=rows)).astype(str).str.zfill(8)
+    hyphenated = digits.str[:5] + "-" + digits.str[5:]
+    return hyphenated.where(rng.random(rows) < 0.5, digits).to_numpy()
+
+def write_sheet(df, path):
+    """Write df as xlsx, csv or parquet, after the suffix of path"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == ".csv":
+        df.to_csv(path, index=False)
+    elif suffix == ".parquet":
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError as e:
+            raise ImportError("Writing parquet requires pyarrow (pip install pyarrow)") from e
+    elif suffix == ".xlsx":
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"xlsx holds at most {XLSX_MAX_ROWS:,} rows, use .csv or .parquet")
+        df.to_excel(path, index=False)
+    else:
+        raise ValueError(f"Unknown sheet format: {suffix}")
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--out", required=True, help="Output file, .xlsx, .csv or .parquet")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--invalid-cpf-ratio", type=float, default=0.01)
+    parser.add_argument("--missing-ratio", type=float, default=0.01)
+    parser.add_argument("--contact-density", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    df = generate_sheet(args.rows, args.duplicate_ratio, args.invalid_cpf_ratio, args.missing_ratio,
+                        args.contact_density, seed=args.seed)
+    print(f"{write_sheet(df, args.out)}: {len(df):,} rows")
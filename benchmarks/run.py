@@ -0,0 +1,158 @@
+"""Time every DataProcessor and loader stage on generated sheets and store the results as JSON.
+Loading needs the database from .env (DB_* variables), point DB_NAME at a throwaway database:
+the loaded tables are WIPED. --no-db only times the processing stages.
+
+    python -m benchmarks.run --rows 10000 100000 1000000 --format csv --loaders bulk copy
+    python -m benchmarks.run --compare benchmarks/results/before.json benchmarks/results/after.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+from src.processor import DataProcessor
+from src.profiler import profiler
+from src.reader import read_sheet
+from src.rejects import DroppedRecords
+from benchmarks.generate import generate_sheet, write_sheet
+
+LOADERS = ("orm", "bulk", "copy", "incremental", "async", "partitioned")
+
+def sheet_path(workdir, rows, fmt, options):
+    """Generated sheets are kept in workdir and reused while rows, format and options match"""
+    tag = "_".join(f"{value:g}" for value in options.values())
+    path = Path(workdir) / f"sheet_{rows}_{tag}.{fmt}"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_sheet(generate_sheet(rows, **options), path)
+    return path
+
+def run_processing(path):
+    profiler.reset()
+    processor = DataProcessor()
+    with profiler.stage("read") as stage:
+        raw = read_sheet(path)
+        stage.rows = len(raw)
+    df = processor.preprocess_frame(raw)
+    clients = processor.extract_clients(df)
+    contracts = processor.extract_contracts(df, clients)
+    return clients, contracts, processor.dropped_records, profiler.report()
+
+def build_loader(name, db_data, batch_size):
+    from src.loader import AsyncLoader, CopyLoader, DataLoader, IncrementalLoader, PartitionedLoader
+    if name == "orm":
+        return DataLoader(db_data, batch_size=batch_size)
+    if name == "bulk":
+        return DataLoader(db_data, bulk=True, batch_size=batch_size)
+    if name == "copy":
+        return CopyLoader(db_data, batch_size=batch_size)
+    if name == "incremental":
+        return IncrementalLoader(db_data, batch_size=batch_size)
+    if name == "partitioned":
+        return PartitionedLoader(db_data, batch_size=batch_size)
+    return AsyncLoader(db_data, batch_size=batch_size)
+
+def run_load(name, db_data, batch_size, clients, contracts, dropped_records):
+    loader = build_loader(name, db_data, batch_size)
+    loader.clean_previous_data()
+    profiler.reset()
+    # A copy, the loader adds the contracts it drops to it
+    dropped = DroppedRecords()
+    dropped.update(dropped_records)
+    stats = loader.load_data(clients, contracts, dropped)
+    report = profiler.report()
+    report["contracts_inserted"] = stats["contracts_inserted"]
+    return report
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count()
+    }
+
+def compare(old_path, new_path, threshold):
+    """Print the wall time of every stage found in both runs, returns how many got slower than threshold"""
+    def index(path):
+        with open(path) as f:
+            results = json.load(f)["results"]
+        return {
+            (r["rows"], r["format"], r["loader"] or "-", stage["stage"]): stage["wall_s"]
+            for r in results for stage in r["stages"]
+        }
+
+    old, new = index(old_path), index(new_path)
+    regressions = 0
+    print(f"{'rows':>9} {'format':>7} {'loader':>11} {'stage':>20} {'before':>9} {'after':>9} {'change':>8}")
+    for key in sorted(old.keys() & new.keys(), key=str):
+        before, after = old[key], new[key]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold and after - before > 0.001:
+            regressions += 1
+            flag = "  SLOWER"
+        print(f"{key[0]:>9} {key[1]:>7} {key[2]:>11} {key[3]:>20} {before:9.3f} {after:9.3f} {change:+8.1%}{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000])
+    parser.add_argument("--format", nargs="+", default=["csv"], choices=["csv", "xlsx", "parquet"])
+    parser.add_argument("--loaders", nargs="+", default=["bulk", "copy"], choices=LOADERS)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--no-db", action="store_true", help="Only time the processing stages")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.05)
+    parser.add_argument("--invalid-cpf-ratio", type=float, default=0.01)
+    parser.add_argument("--missing-ratio", type=float, default=0.01)
+    parser.add_argument("--contact-density", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", default="benchmarks/sheets", help="Where generated sheets are cached")
+    parser.add_argument("--output", help="Results file, benchmarks/results/<date>.json by default")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Diff two results files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    options = {
+        "duplicate_ratio": args.duplicate_ratio, "invalid_cpf_ratio": args.invalid_cpf_ratio,
+        "missing_ratio": args.missing_ratio, "contact_density": args.contact_density, "seed": args.seed
+    }
+    db_data = None
+    if not args.no_db:
+        from src.database import db, initialize_database
+        db_data = initialize_database()
+    profiler.enable(None if args.no_db else db)
+
+    results = []
+    for rows in args.rows:
+        for fmt in args.format:
+            path = sheet_path(args.workdir, rows, fmt, options)
+            clients, contracts, dropped_records, report = run_processing(path)
+            results.append({"rows": rows, "format": fmt, "loader": None, **report})
+            print(f"{rows:>9} {fmt:>7} {'processing':>11}: {report['total']['wall_s']:8.3f}s")
+
+            for name in [] if args.no_db else args.loaders:
+                report = run_load(name, db_data, args.batch_size, clients, contracts, dropped_records)
+                results.append({"rows": rows, "format": fmt, "loader": name, **report})
+                print(f"{rows:>9} {fmt:>7} {name:>11}: {report['total']['wall_s']:8.3f}s")
+
+    output = Path(args.output or f"benchmarks/results/{datetime.now():%Y%m%d-%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"environment": environment(), "options": {**options, "batch_size": args.batch_size},
+                   "results": results}, f, indent=2)
+    print(f"Results written to {output}")
@@ -66,7 +66,8 @@ CREATE TABLE public.tbl_cliente_contratos (
     endereco_complemento character varying(500),
     endereco_cep character varying(9) NOT NULL,
     endereco_uf character varying(2) NOT NULL,
-    status_id integer NOT NULL
+    status_id integer NOT NULL,
+    hash_conteudo character varying(16)
 );
 
 ALTER TABLE public.tbl_cliente_contratos OWNER TO postgres;
@@ -386,6 +387,12 @@ ALTER TABLE ONLY public.tbl_tipos_contato
 ALTER TABLE ONLY public.tbl_tipos_contato
     ADD CONSTRAINT tbl_tipos_contato_tipo_contato_key UNIQUE (tipo_contato);
 
+--
+-- Name: tbl_cliente_contratos_hash_conteudo; Type: INDEX; Schema: public; Owner: postgres
+--
+
+CREATE INDEX tbl_cliente_contratos_hash_conteudo ON public.tbl_cliente_contratos USING btree (hash_conteudo);
+
 --
 -- Name: tbl_cliente_contatos tbl_cliente_contatos_cliente_id_fkey; Type: FK CONSTRAINT; Schema: public; Owner: postgres
 --
@@ -421,6 +428,37 @@ ALTER TABLE ONLY public.tbl_cliente_contratos
 ALTER TABLE ONLY public.tbl_cliente_contratos
     ADD CONSTRAINT tbl_cliente_contratos_status_id_fkey FOREIGN KEY (status_id) REFERENCES public.tbl_status_contrato(id) ON UPDATE CASCADE ON DELETE RESTRICT;
 
+--
+-- Name: tbl_importacoes; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.tbl_importacoes (
+    id bigserial PRIMARY KEY,
+    arquivo character varying(500) NOT NULL,
+    hash_arquivo character varying(64) NOT NULL,
+    estatisticas text NOT NULL,
+    data_importacao timestamp without time zone NOT NULL
+);
+
+ALTER TABLE public.tbl_importacoes OWNER TO postgres;
+
+CREATE INDEX tbl_importacoes_hash_arquivo ON public.tbl_importacoes USING btree (hash_arquivo);
+
+--
+-- Name: tbl_importacao_linhas; Type: TABLE; Schema: public; Owner: postgres
+--
+
+CREATE TABLE public.tbl_importacao_linhas (
+    id bigserial PRIMARY KEY,
+    importacao_id bigint NOT NULL REFERENCES public.tbl_importacoes(id) ON DELETE CASCADE,
+    hash_linha character varying(16) NOT NULL,
+    hash_conteudo character varying(16)
+);
+
+ALTER TABLE public.tbl_importacao_linhas OWNER TO postgres;
+
+CREATE INDEX tbl_importacao_linhas_importacao_id ON public.tbl_importacao_linhas USING btree (importacao_id);
+
 --
 -- PostgreSQL database dump complete
 --
\ No newline at end of file
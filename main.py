@@ -1,36 +1,361 @@
 import argparse
-from src.database import initialize_database
-from src.processor import DataProcessor
-from src.loader import DataLoader
-from src.view import view_import_summary, view_contracts
+import queue
+import signal
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from peewee import fn
+from src.database import db, load_constants, POOL_SIZE, Importacao, LogImportacao
+from src.migrations import deferred_indexes, pending_migrations, restore_indexes
+from src.profiler import profiler
 from src.logger import logger
 
+# pandas, openpyxl and rich are only imported by the subcommands that use them, through the
+# modules imported inside the functions below. Keep it that way: benchmarks/bench_startup.py
+# fails when `main.py --help` or the view path load them again
+
+def uf_type(value):
+    """--uf as a UF, from a state name, alias or abbreviation"""
+    from src.helpers import state_to_uf, STATES_UF
+
+    try:
+        return state_to_uf(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"unknown state {value!r}, expected a state name or one of {', '.join(sorted(STATES_UF.values()))}")
+
+def build_loader(args, db_data):
+    from src.loader import DataLoader, CopyLoader, IncrementalLoader, AsyncLoader, PartitionedLoader
+
+    if args.incremental:
+        return IncrementalLoader(db_data, batch_size=args.batch_size)
+    if args.partitions > 1:
+        return PartitionedLoader(db_data, batch_size=args.batch_size, partitions=args.partitions)
+    if args.concurrency > 1:
+        return AsyncLoader(db_data, batch_size=args.batch_size, concurrency=args.concurrency)
+    loader_cls = CopyLoader if args.copy else DataLoader
+    return loader_cls(db_data, bulk=args.bulk, batch_size=args.batch_size)
+
+def load_indexes(args):
+    """Bulk reloads drop the secondary indexes of the tables they fill and rebuild them once at the end"""
+    if args.incremental or not (args.bulk or args.copy or args.concurrency > 1 or args.partitions > 1):
+        return nullcontext()
+    return deferred_indexes(db, ("tbl_clientes", "tbl_cliente_contatos", "tbl_cliente_contratos"))
+
+def rejects_sink(args, file_hash, start=0):
+    if not args.rejects:
+        return None
+    from src.rejects import open_rejects
+    return open_rejects(args.rejects, args.rejects_dir, args.file, file_hash, start)
+
+def field_rules(args):
+    if not args.rules:
+        return None
+    from src.rules import FieldRules
+    return FieldRules.from_file(args.rules)
+
+def process(args, db_data, raw=None):
+    from src.loader import IncrementalLoader
+    from src.manifest import ImportManifest, row_hashes
+    from src.processor import DataProcessor
+    from src.reader import read_sheet
+
+    manifest = ImportManifest(args.file)
+    # An interrupted reload of a file imported before must go on, not show the earlier run
+    if not args.force and not args.resume:
+        cached = manifest.cached_stats()
+        if cached is not None:
+            logger.info(f"This exact file was imported on {manifest.last.data_importacao}, showing that run")
+            return cached
+
+    if args.chunk_size:
+        stats = process_chunks(args, db_data, manifest.file_hash)
+        manifest.record(stats)
+        return stats
+
+    if raw is None:
+        with profiler.stage("read") as stage:
+            raw = read_sheet(args.file)
+            stage.rows = len(raw)
+    with profiler.stage("hash_rows", len(raw)):
+        hashes = row_hashes(raw)
+
+    removed, kept = None, {}
+    if not args.force and manifest.has_rows():
+        with profiler.stage("manifest_diff", len(hashes)):
+            changed, kept, removed = manifest.diff(hashes)
+        logger.info(f"{len(changed)} new or changed rows and {len(removed)} removed since the last import")
+        raw = raw.loc[changed]
+        loader = IncrementalLoader(db_data, batch_size=args.batch_size)
+    else:
+        loader = build_loader(args, db_data)
+
+    processor = DataProcessor(rejects_sink(args, manifest.file_hash), field_rules(args))
+    with processor.dropped_records:
+        if args.workers > 1:
+            with profiler.stage("preprocess_parallel", len(raw)):
+                clients, contracts, content_hashes = processor.process_parallel(raw, args.workers)
+            logger.info(f"Data pre-processed and transformed on {args.workers} processes")
+        else:
+            df = processor.preprocess_frame(raw)
+            logger.info("Data Frame from sheet file has been pre-processed")
+
+            clients = processor.extract_clients(df)
+            contracts = processor.extract_contracts(df, clients)
+            with profiler.stage("hash_contracts", len(df)):
+                content_hashes = processor.contract_hashes(df)
+            logger.info("Data has been transformed")
+
+        logger.info("On load process... (can take a while)")
+        if removed is not None:
+            stats = loader.load_delta(clients, contracts, removed, processor.dropped_records)
+        else:
+            if not args.incremental:
+                loader.clean_previous_data()
+            with load_indexes(args):
+                stats = loader.load_data(clients, contracts, processor.dropped_records)
+    stats["rules"] = processor.rules.stats
+
+    with profiler.stage("manifest_record", len(hashes)):
+        manifest.record(stats, (
+            (row_hash, kept[idx] if idx in kept else content_hashes.get(idx))
+            for idx, row_hash in hashes.items()
+        ))
+    return stats
+
+def process_chunks(args, db_data, file_hash):
+    """Load the sheet chunk by chunk, each chunk committed along with a checkpoint of how far
+    the import got. --resume carries on from the checkpoint of an import of the same file that
+    stopped halfway, the chunks it committed are neither read nor written again"""
+    from src.manifest import ImportCheckpoint
+    from src.processor import DataProcessor
+
+    loader = build_loader(args, db_data)
+    checkpoint = ImportCheckpoint(args.file, file_hash)
+    # Chunks written on other connections can't share the checkpoint transaction
+    checkpointed = args.concurrency == 1 and args.partitions == 1
+
+    start, chunk_size, stats = 0, args.chunk_size, None
+    if args.resume and checkpoint.interrupted():
+        start, chunk_size, stats = checkpoint.current.linhas, checkpoint.current.tamanho_chunk, checkpoint.stats()
+        logger.info(f"Resuming the import checkpointed on {checkpoint.current.atualizado_em}, "
+                    f"{start} rows already loaded")
+    elif args.resume:
+        logger.info("No interrupted import of this file, starting from the beginning")
+    logger.info(f"Streaming sheet in chunks of {chunk_size} rows")
+
+    processor = DataProcessor(rejects_sink(args, file_hash, start), field_rules(args))
+    if stats is not None:
+        loader.resume(stats)
+        processor.dropped_records.update(stats["dropped_records"])
+        processor.rules.update(stats.get("rules", {}))
+        processor.seen_clients = set(loader.client_ids)
+
+    stats = loader.stats
+    stats["dropped_records"] = processor.dropped_records
+    stats["rules"] = processor.rules.stats
+    fresh = start == 0
+    chunks = processor.iter_chunks(args.file, chunk_size, start)
+    with load_indexes(args), processor.dropped_records:
+        while True:
+            # A chunk is read and cleaned in its transaction too: a bad value raises and rolls
+            # the chunk back, the checkpoint of the chunks before it is kept for --resume
+            with db.atomic() if checkpointed else nullcontext():
+                df = next(chunks, None)
+                if fresh:
+                    # Like the whole-file path, the previous data is only deleted once the sheet could be read
+                    loader.clean_previous_data()
+                    if checkpointed:
+                        checkpoint.start(chunk_size)
+                    fresh = False
+                if df is None:
+                    break
+                clients = processor.extract_clients(df)
+                contracts = processor.extract_contracts(df, clients)
+                stats = loader.load_data(clients, contracts, processor.dropped_records)
+                processor.dropped_records.flush()
+                if checkpointed:
+                    checkpoint.save(processor.rows_read, stats)
+            logger.info(f"Chunk loaded, {stats['contracts_inserted']} contracts so far")
+    # Only reached once the whole sheet was read, errors leave the checkpoint and the manifest alone
+    if checkpointed:
+        checkpoint.finish()
+    return stats
+
+def serve(args, db_data):
+    """Import every sheet that lands in args.watch until interrupted, on a bounded queue.
+    The connection pool, the status/contact type constants and the plan cache stay warm
+    between files, the cached plans are re-read before each load. With several workers
+    sheets are read in parallel, but loads still run one at a time: each import is diffed
+    against the one before it"""
+    from src.loader import DataLoader
+    from src.reader import read_sheet
+    from src.watcher import DirectoryWatcher
+
+    db_data['plans'] = DataLoader.plan_cache(args.batch_size)
+    watcher = DirectoryWatcher(args.watch)
+    files = queue.Queue(maxsize=args.queue_size)
+    load_lock = threading.Lock()
+
+    def import_file(path):
+        file_args = argparse.Namespace(**{**vars(args), "file": path})
+        started, start = datetime.now(), time.perf_counter()
+        status, error, import_id = "imported", None, None
+        with db.connection_context():
+            try:
+                # Worth reading ahead only when another file may be loading meanwhile
+                raw = read_sheet(path) if args.serve_workers > 1 and not args.chunk_size else None
+                with load_lock:
+                    # A failed import leaves ids of rolled back plans behind, and a process
+                    # run meanwhile may have replaced every plan
+                    db_data['plans'].reload()
+                    previous = Importacao.select(fn.MAX(Importacao.id)).scalar()
+                    stats = process(file_args, db_data, raw)
+                    import_id = Importacao.select(fn.MAX(Importacao.id)).scalar()
+                if import_id == previous:
+                    status = "skipped"
+                logger.info(f"{path}: {status}, {stats['contracts_inserted']} contracts inserted, "
+                            f"{stats['dropped_records'].total()} records dropped")
+            except Exception as e:
+                status, error = "failed", f"{type(e).__name__}: {e}"
+                logger.exception(f"{path}: import failed")
+            LogImportacao.create(
+                arquivo=path, importacao=import_id, situacao=status, erro=error,
+                inicio=started, duracao_s=round(time.perf_counter() - start, 3)
+            )
+
+    def work():
+        while (path := files.get()) is not None:
+            import_file(path)
+
+    workers = [threading.Thread(target=work, name=f"import-{i}") for i in range(args.serve_workers)]
+    for worker in workers:
+        worker.start()
+    # SIGTERM (service managers, docker stop) stops like Ctrl+C
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    logger.info(f"Watching {args.watch} for sheets every {args.poll_interval}s, Ctrl+C to stop")
+    try:
+        while not stop.is_set():
+            for path in watcher.poll():
+                # Blocks while the queue is full, new files wait on disk meanwhile
+                files.put(path)
+            stop.wait(args.poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Stopping, the imports already queued are finished first")
+        for _ in workers:
+            files.put(None)
+        for worker in workers:
+            worker.join()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("mode", choices=["process", "view"])
+    parser.add_argument("mode", choices=["process", "view", "dashboard", "export", "serve", "search"])
+    parser.add_argument("query", nargs="?", help="What search looks for: part of a name, a CPF/CNPJ prefix, a phone or an e-mail")
     parser.add_argument("--file", default="data/sheet.xlsx")
+    parser.add_argument("--bulk", action="store_true", help="Load with batched set-based inserts")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per batch on bulk mode")
+    parser.add_argument("--copy", action="store_true", help="Load through COPY into staging tables")
+    parser.add_argument("--concurrency", type=int, default=1, help="Client chunks written at once on pooled connections")
+    parser.add_argument("--partitions", type=int, default=1,
+                        help="Load clients split on a hash of CPF/CNPJ, one transaction and connection per partition")
+    parser.add_argument("--chunk-size", type=int, help="Stream the sheet in chunks of this many rows")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue a chunked import of the same file from its last committed chunk")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Apply only what changed instead of reloading (export: only rows added since the last export)")
+    parser.add_argument("--rejects", choices=["csv", "parquet", "table"],
+                        help="Stream rejected rows to a file per sheet in --rejects-dir or to tbl_registros_rejeitados")
+    parser.add_argument("--rejects-dir", default="rejects", help="Directory --rejects csv/parquet writes to")
+    parser.add_argument("--rules", help="JSON file with the field validation rules to use instead of the default ones")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to pre-process the sheet")
+    parser.add_argument("--force", action="store_true", help="Reprocess the whole file even if it was imported before")
+    parser.add_argument("--profile", action="store_true", help="Time each stage and count database round trips")
+    parser.add_argument("--profile-output", default="profile.json", help="Where --profile writes its JSON report")
+    parser.add_argument("--profile-stage", help="Also dump a cProfile/pyinstrument profile of this stage (e.g. load_contracts)")
+    parser.add_argument("--profile-tool", choices=["cprofile", "pyinstrument"], default="cprofile")
+    parser.add_argument("--page-size", type=int, default=20, help="Contracts shown by view")
+    parser.add_argument("--after-id", type=int, help="Show contracts after this id (the next page)")
+    parser.add_argument("--status", help="Only contracts with this status")
+    parser.add_argument("--plan", help="Only contracts whose plan description contains this")
+    parser.add_argument("--uf", type=uf_type, help="Only contracts in this state (name or UF)")
+    parser.add_argument("--city", help="Only contracts in this city")
+    parser.add_argument("--cpf-cnpj", help="Only contracts of this client")
+    parser.add_argument("--exact-counts", action="store_true", help="Count contracts instead of estimating")
+    parser.add_argument("--limit", type=int, default=20, help="Clients shown by search")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the dashboard aggregates from the contracts")
+    parser.add_argument("--watch", help="Directory serve imports new sheets from")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Seconds between two scans of --watch")
+    parser.add_argument("--queue-size", type=int, default=8, help="Sheets waiting to be imported by serve")
+    parser.add_argument("--serve-workers", type=int, default=1, help="Sheets read at once by serve, loads stay sequential")
+    parser.add_argument("--out", default="export", help="Directory export writes to")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="File format of export")
+    parser.add_argument("--export-batch-size", type=int, default=50_000, help="Rows fetched and written at a time by export")
     args = parser.parse_args()
 
-    db_data = initialize_database()
+    if args.mode == "search" and len((args.query or "").strip()) < 3:
+        parser.error("search needs a query of at least 3 characters")
+    if args.mode == "serve" and not args.watch:
+        parser.error("serve needs a directory to --watch")
+    if args.mode in ("process", "serve") and args.incremental and (args.chunk_size or args.copy):
+        parser.error("--incremental needs the whole sheet at once, it can't be combined with --chunk-size or --copy")
+    if args.partitions > 1 and (args.incremental or args.copy or args.concurrency > 1):
+        parser.error("--partitions is a loader of its own, it can't be combined with --incremental, --copy or --concurrency")
+    if args.resume and not args.chunk_size:
+        parser.error("--resume continues a chunked import, it needs --chunk-size")
+    if args.resume and (args.incremental or args.concurrency > 1 or args.partitions > 1):
+        parser.error("--resume needs chunks committed on a single connection, it can't be combined with "
+                     "--incremental, --concurrency or --partitions")
+    if args.workers > 1 and args.chunk_size:
+        parser.error("--workers splits the whole sheet, it can't be combined with --chunk-size")
+    # The connection opened below stays checked out while the loader writes on its own ones,
+    # and every serve worker holds one for its whole import
+    writers = max(args.concurrency, args.partitions)
+    connections = 1 + (writers if writers > 1 else 0) + (args.serve_workers if args.mode == "serve" else 0)
+    if args.mode in ("process", "serve") and connections > POOL_SIZE:
+        parser.error(f"--concurrency/--partitions/--serve-workers need DB_POOL_SIZE of at least {connections}, "
+                     f"it is {POOL_SIZE}")
+
+    if args.profile:
+        profiler.enable(db, hot_stage=args.profile_stage, tool=args.profile_tool)
+
+    db.connect()
     logger.info("Data base is connect and ready for pairing!")
+    if pending_migrations(db):
+        logger.warning("The database schema is behind, run `python setup.py migrate`")
+    elif restored := restore_indexes(db):
+        logger.warning(f"Rebuilt {len(restored)} indexes an interrupted bulk load left dropped: {', '.join(restored)}")
 
     if args.mode == "view":
-        view_contracts()
+        from src.view import view_contracts
+        view_contracts(
+            page_size=args.page_size, after_id=args.after_id, exact_counts=args.exact_counts,
+            status=args.status, plan=args.plan, uf=args.uf, city=args.city, cpf_cnpj=args.cpf_cnpj
+        )
+    elif args.mode == "search":
+        from src.view import view_search
+        view_search(args.query, args.limit)
+    elif args.mode == "dashboard":
+        from src.view import view_dashboard
+        view_dashboard(refresh=args.refresh)
+    elif args.mode == "serve":
+        serve(args, load_constants())
+    elif args.mode == "export":
+        from src.exporter import DataExporter
+        from src.view import view_export_summary
+        exporter = DataExporter(args.out, args.format, args.export_batch_size, incremental=args.incremental)
+        view_export_summary(exporter.export(), args.out)
     else:
-        processor = DataProcessor()
-        
-        df = processor.preprocess_data(args.file)
-        logger.info("Data Frame from sheet file has been pre-processed")
-
-        clients = processor.extract_clients(df)
-        contracts = processor.extract_contracts(df, clients)
-        logger.info("Data has been transformed")
-
-        loader = DataLoader(db_data)
-        loader.clean_previous_data()
-        logger.info("On load process... (can take a while)")
-        stats = loader.load_data(clients, contracts, processor.dropped_records)
+        from src.view import view_import_summary
+        stats = process(args, load_constants())
 
         logger.info("Data loaded on database")
         logger.info("Visual summary:\n")
         view_import_summary(stats)
+
+    if args.profile:
+        from src.view import view_profile
+        view_profile(profiler.write(args.profile_output))
@@ -1,20 +1,37 @@
 import os
 import subprocess
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 from peewee import PostgresqlDatabase
+from src.migrations import apply_migrations
 
-def setup_database():
-    """Initialize the database and load data from dump file"""
+def database_config():
     # Load environment variables
     load_dotenv()
-    
+
     # Database configuration from environment
-    db_name = os.getenv("DB_NAME", "tsmx")
-    db_user = os.getenv("DB_USER", "postgres")
-    db_pass = os.getenv("DB_PASS", "admin")
-    db_host = os.getenv("DB_HOST", "localhost")
-    db_port = os.getenv("DB_PORT", "5432")
+    return {
+        "db_name": os.getenv("DB_NAME", "tsmx"),
+        "db_user": os.getenv("DB_USER", "postgres"),
+        "db_pass": os.getenv("DB_PASS", "admin"),
+        "db_host": os.getenv("DB_HOST", "localhost"),
+        "db_port": os.getenv("DB_PORT", "5432")
+    }
+
+def migrate_database(db):
+    """Bring the schema up to date with src/migrations.py"""
+    applied = apply_migrations(db)
+    if applied:
+        print(f"Migrations applied: {', '.join(map(str, applied))}")
+    else:
+        print("Schema is up to date")
+
+def setup_database():
+    """Initialize the database and load data from dump file"""
+    config = database_config()
+    db_name, db_user, db_pass = config["db_name"], config["db_user"], config["db_pass"]
+    db_host, db_port = config["db_host"], config["db_port"]
 
     # Connect to default PostgreSQL database to create new DB
     admin_db = PostgresqlDatabase(
@@ -70,5 +87,17 @@ def setup_database():
     else:
         print(f"Dump file not found at {dump_file}")
 
+    migrate_database(db)
+
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    if sys.argv[1:] == ["migrate"]:
+        config = database_config()
+        migrate_database(PostgresqlDatabase(
+            config["db_name"],
+            user=config["db_user"],
+            password=config["db_pass"],
+            host=config["db_host"],
+            port=config["db_port"]
+        ))
+    else:
+        setup_database()
\ No newline at end of file
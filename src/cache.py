@@ -0,0 +1,75 @@
+import threading
+from peewee import chunked
+
+class DimensionCache:
+    """In-memory key -> id map for a small lookup table (plans, statuses, contact types).
+    Loaded once, then every lookup is served from memory. When insert_missing is set,
+    unknown keys are created in batched inserts instead of one get_or_create per row"""
+
+    def __init__(self, model, fields, ids=None, key=None, insert_missing=False, batch_size=1000):
+        self.model = model
+        self.fields = fields
+        self.key = key or (lambda *values: values[0] if len(values) == 1 else values)
+        self.insert_missing = insert_missing
+        self.batch_size = batch_size
+        self.hits = self.misses = self.inserted = 0
+        self._lock = threading.Lock()
+        self.ids = dict(ids) if ids is not None else self._load()
+
+    def _load(self):
+        pk = self.model._meta.primary_key
+        query = self.model.select(pk, *self.fields).tuples()
+        return {self.key(*row[1:]): row[0] for row in query}
+
+    def get(self, key):
+        """Id of a key built with self.key, None when it is unknown and can't be inserted"""
+        with self._lock:
+            if key in self.ids:
+                self.hits += 1
+                return self.ids[key]
+            self.misses += 1
+        if self.insert_missing:
+            self._insert([key])
+            return self.ids[key]
+        return None
+
+    def resolve(self, keys):
+        """Make sure every key has an id, inserting the unknown ones together. Returns the key -> id map"""
+        missing = {}
+        with self._lock:
+            for key in keys:
+                if key in self.ids or key in missing:
+                    self.hits += 1
+                else:
+                    missing[key] = True
+                    self.misses += 1
+        if missing and self.insert_missing:
+            self._insert(list(missing))
+        return self.ids
+
+    def _insert(self, keys):
+        pk = self.model._meta.primary_key
+        names = [field.name for field in self.fields]
+        for batch in chunked(keys, self.batch_size):
+            rows = [dict(zip(names, key if isinstance(key, tuple) else (key,))) for key in batch]
+            inserted = self.model.insert_many(rows).returning(pk, *self.fields).tuples().execute()
+            with self._lock:
+                for row in inserted:
+                    self.ids[self.key(*row[1:])] = row[0]
+                    self.inserted += 1
+
+    def reload(self):
+        """Read every id from the table again, dropping the ones of inserts that were rolled
+        back and picking up rows other processes changed"""
+        ids = self._load()
+        with self._lock:
+            self.ids.clear()
+            self.ids.update(ids)
+
+    def clear(self):
+        """Forget every id, for when the table itself was emptied"""
+        with self._lock:
+            self.ids.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "inserted": self.inserted}
@@ -1,20 +1,26 @@
 from os import getenv
 from dotenv import load_dotenv
+from playhouse.pool import PooledPostgresqlDatabase
 from peewee import (
-    Model, PostgresqlDatabase,
-    BigAutoField, AutoField, CharField, DateField, DateTimeField,
-    IntegerField, BooleanField, DecimalField, ForeignKeyField
+    Model, CompositeKey,
+    BigAutoField, AutoField, BigIntegerField, CharField, DateField, DateTimeField,
+    IntegerField, BooleanField, DecimalField, ForeignKeyField, TextField
 )
 
 # Load enviorment variables
 load_dotenv()
 
-db = PostgresqlDatabase(
+# Pooled so concurrent loaders get one connection per thread, single-threaded code is unaffected
+POOL_SIZE = int(getenv("DB_POOL_SIZE", 8))
+db = PooledPostgresqlDatabase(
     getenv("DB_NAME"),
     user=getenv("DB_USER"),
     password=getenv("DB_PASS"),
     host=getenv("DB_HOST"),
-    port=getenv("DB_PORT")
+    port=getenv("DB_PORT"),
+    max_connections=POOL_SIZE,
+    stale_timeout=300,
+    timeout=30
 )
 
 class BaseModel(Model):
@@ -78,13 +84,85 @@ class ClienteContrato(BaseModel):
     endereco_cep = CharField(max_length=9, null=False)
     endereco_uf = CharField(max_length=2, null=False)
     status = ForeignKeyField(StatusContrato, backref='contratos', on_delete='RESTRICT')
+    hash_conteudo = CharField(max_length=16, null=True, index=True)
 
     class Meta:
         table_name = 'tbl_cliente_contratos'
 
-def initialize_database():
-    db.connect()
+class Importacao(BaseModel):
+    id = BigAutoField()
+    arquivo = CharField(max_length=500, null=False)
+    hash_arquivo = CharField(max_length=64, null=False, index=True)
+    estatisticas = TextField(null=False)
+    data_importacao = DateTimeField(null=False)
+
+    class Meta:
+        table_name = 'tbl_importacoes'
+
+class ImportacaoLinha(BaseModel):
+    id = BigAutoField()
+    importacao = ForeignKeyField(Importacao, backref='linhas', on_delete='CASCADE')
+    hash_linha = CharField(max_length=16, null=False)
+    hash_conteudo = CharField(max_length=16, null=True)
+
+    class Meta:
+        table_name = 'tbl_importacao_linhas'
+
+class CheckpointImportacao(BaseModel):
+    id = BigAutoField()
+    arquivo = CharField(max_length=500, null=False)
+    hash_arquivo = CharField(max_length=64, null=False, index=True)
+    tamanho_chunk = IntegerField(null=False)
+    linhas = BigIntegerField(default=0, null=False)
+    estatisticas = TextField(null=True)
+    atualizado_em = DateTimeField(null=False)
+
+    class Meta:
+        table_name = 'tbl_importacao_checkpoints'
+
+class RegistroRejeitado(BaseModel):
+    id = BigAutoField()
+    arquivo = CharField(max_length=500, null=False)
+    hash_arquivo = CharField(max_length=64, null=False, index=True)
+    categoria = CharField(max_length=50, null=False)
+    linha = BigIntegerField(null=True)
+    identificador = TextField(null=True)
+    motivo = TextField(null=True)
+
+    class Meta:
+        table_name = 'tbl_registros_rejeitados'
+
+class LogImportacao(BaseModel):
+    id = BigAutoField()
+    arquivo = CharField(max_length=500, null=False)
+    importacao = ForeignKeyField(Importacao, backref='logs', null=True, on_delete='SET NULL')
+    situacao = CharField(max_length=20, null=False)
+    erro = TextField(null=True)
+    inicio = DateTimeField(null=False)
+    duracao_s = DecimalField(max_digits=12, decimal_places=3, null=False)
+
+    class Meta:
+        table_name = 'tbl_log_importacoes'
+
+class ResumoContrato(BaseModel):
+    dimensao = CharField(max_length=20, null=False)
+    chave = CharField(max_length=300, null=False)
+    contratos = BigIntegerField(default=0, null=False)
+    isentos = BigIntegerField(default=0, null=False)
+    mrr = DecimalField(max_digits=15, decimal_places=2, default=0, null=False)
+    clientes = BigIntegerField(null=True)
+
+    class Meta:
+        table_name = 'tbl_resumo_contratos'
+        primary_key = CompositeKey('dimensao', 'chave')
+
+def load_constants():
+    """Lookup ids the loaders need, the read-only subcommands go without them"""
     return {
         'contact_types': {c.tipo_contato: c.id for c in TipoContato.select()},
         'status_ids': {s.status: s.id for s in StatusContrato.select()}
-    }
\ No newline at end of file
+    }
+
+def initialize_database():
+    db.connect()
+    return load_constants()
\ No newline at end of file
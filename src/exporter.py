@@ -0,0 +1,144 @@
+import json
+import os
+import shutil
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+import pandas as pd
+from peewee import fn
+from .database import *
+from .profiler import profiler
+from .view import iter_server_side
+from .writers import open_writer, require_pyarrow
+
+WATERMARK_FILE = "_watermarks.json"
+
+# Column name and type of every exported dataset, the types only matter to parquet
+CLIENT_COLUMNS = [
+    ("id", "int64"), ("nome_razao_social", "string"), ("nome_fantasia", "string"),
+    ("cpf_cnpj", "string"), ("data_nascimento", "date"), ("data_cadastro", "timestamp")
+]
+CONTACT_COLUMNS = [
+    ("id", "int64"), ("cliente_id", "int64"), ("tipo_contato", "string"), ("contato", "string")
+]
+CONTRACT_COLUMNS = [
+    ("id", "int64"), ("cliente_id", "int64"), ("plano", "string"), ("plano_valor", "decimal"),
+    ("dia_vencimento", "int64"), ("isento", "bool"), ("status", "string"),
+    ("endereco_logradouro", "string"), ("endereco_numero", "string"), ("endereco_bairro", "string"),
+    ("endereco_cidade", "string"), ("endereco_complemento", "string"), ("endereco_cep", "string"),
+    ("endereco_uf", "string")
+]
+
+def _clients_query():
+    return Cliente.select(
+        Cliente.id, Cliente.nome_razao_social, Cliente.nome_fantasia,
+        Cliente.cpf_cnpj, Cliente.data_nascimento, Cliente.data_cadastro
+    )
+
+def _contacts_query():
+    return (ClienteContato
+            .select(ClienteContato.id, ClienteContato.cliente, TipoContato.tipo_contato, ClienteContato.contato)
+            .join(TipoContato, on=(ClienteContato.tipo_contato == TipoContato.id)))
+
+def _contracts_query():
+    return (ClienteContrato
+            .select(
+                ClienteContrato.id, ClienteContrato.cliente, Plano.descricao, Plano.valor,
+                ClienteContrato.dia_vencimento, ClienteContrato.isento, StatusContrato.status,
+                ClienteContrato.endereco_logradouro, ClienteContrato.endereco_numero,
+                ClienteContrato.endereco_bairro, ClienteContrato.endereco_cidade,
+                ClienteContrato.endereco_complemento, ClienteContrato.endereco_cep,
+                ClienteContrato.endereco_uf
+            )
+            .join(Plano, on=(ClienteContrato.plano == Plano.id))
+            .switch(ClienteContrato)
+            .join(StatusContrato, on=(ClienteContrato.status == StatusContrato.id)))
+
+# name: (model, query, columns, partition column)
+DATASETS = {
+    "clients": (Cliente, _clients_query, CLIENT_COLUMNS, None),
+    "contacts": (ClienteContato, _contacts_query, CONTACT_COLUMNS, None),
+    "contracts": (ClienteContrato, _contracts_query, CONTRACT_COLUMNS, "endereco_uf")
+}
+
+class DataExporter:
+    """Streams the normalized tables out of the database as csv or parquet files.
+
+    Rows are read batch_size at a time through server-side cursors and appended to one file per
+    partition (contracts are split by UF, as uf=XX directories), so memory stays bounded whatever
+    the table sizes. The highest id exported from each table is kept in out_dir, an incremental
+    export only writes the rows inserted since. Rows updated in place keep their id and are
+    not picked up again, and a full reload gives every row a new id: run a full export after those."""
+
+    def __init__(self, out_dir, fmt="csv", batch_size=50_000, incremental=False):
+        if fmt not in ("csv", "parquet"):
+            raise ValueError(f"Unknown export format: {fmt}")
+        self.out_dir = Path(out_dir)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.watermarks = self._read_watermarks() if incremental else {}
+        if fmt == "parquet":
+            # Fail before anything already exported gets removed
+            require_pyarrow("Exporting parquet")
+
+    def _read_watermarks(self):
+        path = self.out_dir / WATERMARK_FILE
+        if not path.exists():
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_watermarks(self, watermarks):
+        path = self.out_dir / WATERMARK_FILE
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(watermarks, f, indent=2)
+        os.replace(tmp, path)
+
+    def export(self):
+        """Export every dataset, returns the rows, files and watermark of each one"""
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        # Files of an incremental run sit next to the previous ones instead of replacing them
+        run = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+        # Upper bounds are taken before reading anything, so rows inserted by an import running
+        # meanwhile are left whole for the next export instead of half of them showing up now
+        upper = {name: model.select(fn.MAX(model.id)).scalar() or 0 for name, (model, *_) in DATASETS.items()}
+
+        stats = {}
+        for name, (model, query, columns, partition) in DATASETS.items():
+            after = self.watermarks.get(name, 0)
+            target = self.out_dir / name
+            if not self.incremental and target.exists():
+                shutil.rmtree(target)
+
+            rows = query().where((model.id > after) & (model.id <= upper[name])).order_by(model.id)
+            with profiler.stage(f"export_{name}") as stage:
+                stage.rows, files = self._write(rows, target, f"part-{run}", columns, partition)
+            stats[name] = {"rows": stage.rows, "files": files, "watermark": max(after, upper[name])}
+
+        self._write_watermarks({name: s["watermark"] for name, s in stats.items()})
+        return stats
+
+    def _write(self, query, target, basename, columns, partition):
+        names = [name for name, _ in columns]
+        writers = {}
+        total = 0
+        cursor = iter_server_side(query, itersize=self.batch_size, name="export")
+        try:
+            while batch := list(islice(cursor, self.batch_size)):
+                df = pd.DataFrame.from_records(batch, columns=names)
+                groups = df.groupby(partition, sort=False) if partition else [(None, df)]
+                for key, part in groups:
+                    if key not in writers:
+                        directory = target / f"uf={key}" if partition else target
+                        directory.mkdir(parents=True, exist_ok=True)
+                        writers[key] = open_writer(self.fmt, directory / f"{basename}.{self.fmt}", columns)
+                    writers[key].write(part)
+                total += len(df)
+        finally:
+            cursor.close()
+            for writer in writers.values():
+                writer.close()
+        return total, len(writers)
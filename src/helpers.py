@@ -1,5 +1,8 @@
 import unicodedata
 import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
 
 def check_cpf(cpf : str):
     cpf = re.sub(r'\D', '', cpf)
@@ -9,43 +12,138 @@ def check_cpf(cpf : str):
         if int(cpf[i]) != (val * 10 % 11) % 10: return False
     return True
 
+# Check digit weights, each row computes one verifier digit over the leading digits
+CPF_WEIGHTS = (
+    np.array([10, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32),
+    np.array([11, 10, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32)
+)
+CNPJ_WEIGHTS = (
+    np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32),
+    np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32)
+)
+
+# Where the digits go inside the canonical formatting, the remaining positions hold punctuation
+CPF_LAYOUT = "000.000.000-00"
+CNPJ_LAYOUT = "00.000.000/0000-00"
+
+def validate_cpf_cnpj(values):
+    """Validate a column of CPFs (11 digits) and CNPJs (14 digits) at once.
+    Returns a boolean mask and the values in canonical format (000.000.000-00 / 00.000.000/0000-00)"""
+    values = pd.Series(values)
+    texts = values.astype(str).tolist()
+
+    # One byte per character for the whole column, non-ascii characters become '?'
+    buffer = np.frombuffer(''.join(texts).encode('ascii', 'replace'), dtype=np.uint8)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    is_digit = (buffer >= ord('0')) & (buffer <= ord('9'))
+    digit_counts = np.bincount(
+        np.repeat(np.arange(len(texts)), lengths)[is_digit], minlength=len(texts)
+    )
+    row_of_digit = np.repeat(np.arange(len(texts)), digit_counts)
+    digits = (buffer[is_digit] - ord('0')).astype(np.int8)
+
+    valid = np.zeros(len(texts), dtype=bool)
+    canonical = values.to_numpy(dtype=object, copy=True)
+    for size, check, layout in ((11, _cpf_check_digits, CPF_LAYOUT), (14, _cnpj_check_digits, CNPJ_LAYOUT)):
+        rows = digit_counts == size
+        if not rows.any():
+            continue
+        matrix = digits[rows[row_of_digit]].reshape(-1, size)
+        first, second = check(matrix)
+        repeated = (matrix == matrix[:, :1]).all(axis=1)
+        ok = (matrix[:, -2] == first) & (matrix[:, -1] == second) & ~repeated
+        valid[rows] = ok
+
+        layout_bytes = np.frombuffer(layout.encode('ascii'), dtype=np.uint8)
+        formatted = np.tile(layout_bytes, (int(ok.sum()), 1))
+        formatted[:, layout_bytes == ord('0')] = matrix[ok] + ord('0')
+        canonical[np.flatnonzero(rows)[ok]] = np.char.decode(formatted.view(f"S{len(layout)}").ravel(), 'ascii')
+
+    return pd.Series(valid, index=values.index), pd.Series(canonical, index=values.index)
+
+def _cpf_check_digits(matrix):
+    first = (matrix[:, :9] @ CPF_WEIGHTS[0]) * 10 % 11 % 10
+    second = (matrix[:, :10] @ CPF_WEIGHTS[1]) * 10 % 11 % 10
+    return first, second
+
+def _cnpj_check_digits(matrix):
+    def digit(total):
+        rest = total % 11
+        return np.where(rest < 2, 0, 11 - rest)
+    return digit(matrix[:, :12] @ CNPJ_WEIGHTS[0]), digit(matrix[:, :13] @ CNPJ_WEIGHTS[1])
+
+# Distinct spellings seen in free text are few, so normalizations are memoized
+@lru_cache(maxsize=4096)
 def normalize_text(text):
     return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn').lower()
 
+STATES_UF = {
+    'amapa': 'AP',
+    'acre': 'AC',
+    'alagoas': 'AL',
+    'amazonas': 'AM',
+    'bahia': 'BA',
+    'ceara': 'CE',
+    'distrito federal': 'DF',
+    'espirito santo': 'ES',
+    'goias': 'GO',
+    'maranhao': 'MA',
+    'mato grosso': 'MT',
+    'mato grosso do sul': 'MS',
+    'minas gerais': 'MG',
+    'para': 'PA',
+    'paraiba': 'PB',
+    'parana': 'PR',
+    'pernambuco': 'PE',
+    'piaui': 'PI',
+    'rio de janeiro': 'RJ',
+    'rio grande do norte': 'RN',
+    'rio grande do sul': 'RS',
+    'rondonia': 'RO',
+    'roraima': 'RR',
+    'santa catarina': 'SC',
+    'sao paulo': 'SP',
+    'sergipe': 'SE',
+    'tocantins': 'TO'
+}
+
+# Spellings found in typed sheets, after _state_key
+STATE_ALIASES = {
+    's paulo': 'SP',
+    'sampa': 'SP',
+    's catarina': 'SC',
+    'sta catarina': 'SC',
+    'r de janeiro': 'RJ',
+    'rio grande norte': 'RN',
+    'rio grande sul': 'RS',
+    'r g do norte': 'RN',
+    'r g do sul': 'RS',
+    'mato grosso sul': 'MS',
+    'm grosso': 'MT',
+    'm grosso do sul': 'MS',
+    'e santo': 'ES',
+    'espirito sto': 'ES',
+    'm gerais': 'MG',
+    'brasilia': 'DF'
+}
+
+# Full names, aliases and the abbreviations themselves, all keyed like _state_key
+UF_LOOKUP = {**STATES_UF, **STATE_ALIASES, **{uf.lower(): uf for uf in STATES_UF.values()}}
+
+@lru_cache(maxsize=4096)
+def _state_key(state):
+    # "S. Paulo ", "são  paulo" and "SAO-PAULO" all become "s paulo" / "sao paulo"
+    return ' '.join(re.sub(r'[^a-z]+', ' ', normalize_text(state)).split())
+
 def state_to_uf(state):
-    states_uf = {
-        'amapa': 'AP',
-        'acre': 'AC',
-        'alagoas': 'AL',
-        'amazonas': 'AM',
-        'bahia': 'BA',
-        'ceara': 'CE',
-        'distrito federal': 'DF',
-        'espirito santo': 'ES',
-        'goias': 'GO',
-        'maranhao': 'MA',
-        'mato grosso': 'MT',
-        'mato grosso do sul': 'MS',
-        'minas gerais': 'MG',
-        'para': 'PA',
-        'paraiba': 'PB',
-        'parana': 'PR',
-        'pernambuco': 'PE',
-        'piaui': 'PI',
-        'rio de janeiro': 'RJ',
-        'rio grande do norte': 'RN',
-        'rio grande do sul': 'RS',
-        'rondonia': 'RO',
-        'roraima': 'RR',
-        'santa catarina': 'SC',
-        'sao paulo': 'SP',
-        'sergipe': 'SE',
-        'tocantins': 'TO'
-    }
-    
-    state = normalize_text(state.strip())
-
-    if state not in states_uf:
-        raise ValueError(f"UF not found for state: {state.capitalize()}")
-    
-    return states_uf[state]
\ No newline at end of file
+    uf = UF_LOOKUP.get(_state_key(state))
+    if uf is None:
+        raise ValueError(f"UF not found for state: {normalize_text(state.strip()).capitalize()}")
+    return uf
+
+def states_to_uf(values):
+    """UF of every state in a Series, resolving each distinct spelling once"""
+    codes, uniques = pd.factorize(values)
+    ufs = np.array([state_to_uf(state) for state in uniques] + [None], dtype=object)
+    # factorize gives -1 for missing values, which picks the trailing None
+    return pd.Series(ufs.take(codes), index=values.index)
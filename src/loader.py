@@ -1,97 +1,641 @@
+import asyncio
+import csv
+import io
+import zlib
 import pandas as pd
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from peewee import EXCLUDED, SQL, Expression, Tuple, Value, chunked, fn
 from .database import *
+from .cache import DimensionCache
+from .profiler import profiler
+from .records import DroppedRecord
+from .summary import ContractSummary
+
+def _na_to_none(value):
+    return None if value is None or (not isinstance(value, str) and pd.isna(value)) else value
 
 class DataLoader:
-    def __init__(self, db_constants):
-        self.contact_types = db_constants['contact_types']
-        self.status_ids = db_constants['status_ids']
+    def __init__(self, db_constants, bulk=False, batch_size=1000):
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.contact_types = DimensionCache(TipoContato, (TipoContato.tipo_contato,), ids=db_constants['contact_types'])
+        self.statuses = DimensionCache(StatusContrato, (StatusContrato.status,), ids=db_constants['status_ids'])
+        # A long running server passes its own plan cache, kept warm from one import to the next
+        self.plans = db_constants.get('plans') or self.plan_cache(batch_size)
+        self.summary = ContractSummary(batch_size)
+        # Kept across load_data calls so chunked imports can reference earlier clients
+        self.client_ids = {}
         self.stats = {
             "clients_total": 0, "clients_inserted": 0, "clients_existed": 0,
             "contacts_inserted": 0, "contracts_inserted": 0, "plans_inserted": 0
         }
 
     def load_data(self, clients, contracts, dropped_records):
-        self.stats["clients_total"] = len(clients)
-        client_ids = self._process_clients(clients)
-        self._process_contracts(contracts, client_ids)
+        return self._load(clients, contracts, dropped_records, self._write)
+
+    def _load(self, clients, contracts, dropped_records, write):
+        """Steps every loader shares around write(clients, contracts), which stores the rows"""
+        self.stats["clients_total"] += len(clients)
+        try:
+            write(clients, self._check_statuses(contracts, dropped_records))
+            return self._finish_load(dropped_records)
+        except BaseException:
+            # Per row, chunk and partition writes are committed as they go and the summary would
+            # miss them. Inside the caller's transaction they roll back with it instead
+            if not db.in_transaction():
+                self.summary.invalidate()
+            raise
+
+    def _write(self, clients, contracts):
+        if self.bulk:
+            with db.atomic():
+                self.client_ids.update(self._bulk_process_clients(clients))
+                self._bulk_process_contracts(contracts, self.client_ids)
+        else:
+            client_ids = self._process_clients(clients)
+            self._process_contracts(contracts, client_ids)
+
+    def clean_previous_data(self):
+        with profiler.stage("clean_previous"):
+            ClienteContrato.delete().execute()
+            ClienteContato.delete().execute()
+            Cliente.delete().execute()
+            Plano.delete().execute()
+            # Interrupted chunked imports can't be resumed on top of emptied tables
+            CheckpointImportacao.delete().execute()
+            self.summary.reset()
+        self.plans.clear()
+
+    def resume(self, stats):
+        """Pick up a chunked import from its checkpoint stats, the clients it already
+        loaded come back from the database"""
+        for key in self.stats:
+            self.stats[key] = stats.get(key, 0)
+        for name, cache in (("plans", self.plans), ("statuses", self.statuses), ("contact_types", self.contact_types)):
+            counters = stats.get("cache", {}).get(name, {})
+            cache.hits, cache.misses, cache.inserted = (counters.get(k, 0) for k in ("hits", "misses", "inserted"))
+        self.client_ids = dict(Cliente.select(Cliente.cpf_cnpj, Cliente.id).tuples())
+
+    def _finish_load(self, dropped_records):
+        with profiler.stage("summary"):
+            self.summary.apply()
         self.stats["dropped_records"] = dropped_records
+        self.stats["cache"] = {
+            "plans": self.plans.stats(),
+            "statuses": self.statuses.stats(),
+            "contact_types": self.contact_types.stats()
+        }
         return self.stats
 
-    def clean_previous_data(self):
-        ClienteContrato.delete().execute()
-        ClienteContato.delete().execute()
-        Cliente.delete().execute()
-        Plano.delete().execute()
+    def _check_statuses(self, contracts, dropped_records):
+        """Drop contracts whose status isn't in tbl_status_contrato instead of storing them without one"""
+        known = []
+        for contract in contracts:
+            if self.statuses.get(contract.status) is None:
+                dropped_records.add("other_errors", [DroppedRecord(
+                    identifier=contract.cliente_cpf_cnpj,
+                    reason=f"Unknown contract status: {contract.status}"
+                )])
+            else:
+                known.append(contract)
+        return known
 
     def _process_clients(self, clients):
-        client_ids = {}
-        for client in clients:
-            existing = Cliente.select().where(Cliente.cpf_cnpj == client["cpf_cnpj"]).first()
-            if existing:
-                client_ids[client["cpf_cnpj"]] = existing.id
-                self.stats["clients_existed"] += 1
-            else:
-                new_client = Cliente.create(**self._get_client_data(client))
-                client_ids[client["cpf_cnpj"]] = new_client.id
-                self.stats["clients_inserted"] += 1
-            self._process_contacts(client, client_ids[client["cpf_cnpj"]])
-        return client_ids
+        with profiler.stage("load_clients", len(clients)):
+            client_ids = self.client_ids
+            for client in clients:
+                existing = Cliente.select().where(Cliente.cpf_cnpj == client.cpf_cnpj).first()
+                if existing:
+                    client_ids[client.cpf_cnpj] = existing.id
+                    self.stats["clients_existed"] += 1
+                else:
+                    new_client = Cliente.create(**self._get_client_data(client))
+                    client_ids[client.cpf_cnpj] = new_client.id
+                    self.stats["clients_inserted"] += 1
+                self._process_contacts(client, client_ids[client.cpf_cnpj])
+            return client_ids
 
     def _get_client_data(self, client):
         return {
-            'nome_razao_social': client["nome_razao_social"],
-            'nome_fantasia': client.get("nome_fantasia", ""),
-            'cpf_cnpj': client["cpf_cnpj"],
-            'data_nascimento': None if pd.isna(client.get("data_nascimento")) else client.get("data_nascimento"),
-            'data_cadastro': client["data_cadastro"]
+            'nome_razao_social': client.nome_razao_social,
+            'nome_fantasia': _na_to_none(client.nome_fantasia),
+            'cpf_cnpj': client.cpf_cnpj,
+            'data_nascimento': _na_to_none(client.data_nascimento),
+            'data_cadastro': client.data_cadastro
         }
 
     def _process_contacts(self, client, client_id):
-        for contact in client["contatos"]:
-            if contact["tipo"] in self.contact_types:
+        for contact in client.contatos:
+            type_id = self.contact_types.get(contact.tipo)
+            if type_id is not None:
                 if not ClienteContato.select().where(
                     (ClienteContato.cliente == client_id) &
-                    (ClienteContato.tipo_contato == self.contact_types[contact["tipo"]]) &
-                    (ClienteContato.contato == contact["contato"])
+                    (ClienteContato.tipo_contato == type_id) &
+                    (ClienteContato.contato == contact.contato)
                 ).exists():
                     ClienteContato.create(
                         cliente=client_id,
-                        tipo_contato=self.contact_types[contact["tipo"]],
-                        contato=contact["contato"]
+                        tipo_contato=type_id,
+                        contato=contact.contato
                     )
                     self.stats["contacts_inserted"] += 1
 
     def _process_contracts(self, contracts, client_ids):
-        for contract in contracts:
-            if contract["cliente_cpf_cnpj"] in client_ids:
-                plan, created = Plano.get_or_create(
-                    descricao=contract["plano"]["descricao"],
-                    valor=contract["plano"]["valor"]
-                )
-                if created:
-                    self.stats["plans_inserted"] += 1
+        with profiler.stage("load_contracts", len(contracts)):
+            for contract in contracts:
+                if contract.cliente_cpf_cnpj in client_ids:
+                    inserted = self.plans.inserted
+                    plan_id = self.plans.get(self._plan_key(contract.plano_descricao, contract.plano_valor))
+                    self.stats["plans_inserted"] += self.plans.inserted - inserted
 
-                ClienteContrato.create(
-                    cliente=client_ids[contract["cliente_cpf_cnpj"]],
-                    plano=plan.id,
-                    **self._get_contract_data(contract)
-                )
-                self.stats["contracts_inserted"] += 1
+                    data = {
+                        'cliente': client_ids[contract.cliente_cpf_cnpj],
+                        'plano': plan_id,
+                        **self._get_contract_data(contract)
+                    }
+                    ClienteContrato.create(**data)
+                    self.summary.add([data])
+                    self.stats["contracts_inserted"] += 1
 
     def _get_contract_data(self, contract):
         return {
-            'dia_vencimento': contract["dia_vencimento"],
-            'isento': contract["isento"],
-            'endereco_logradouro': contract["endereco_logradouro"],
-            'endereco_numero': contract.get("endereco_numero", ""),
-            'endereco_bairro': contract["endereco_bairro"],
-            'endereco_cidade': contract["endereco_cidade"],
-            'endereco_complemento': contract.get("endereco_complemento", ""),
-            'endereco_cep': contract["endereco_cep"],
-            'endereco_uf': contract["endereco_uf"],
-            'status': self.status_ids.get(contract["status"])
+            'dia_vencimento': contract.dia_vencimento,
+            'isento': contract.isento,
+            'endereco_logradouro': contract.endereco_logradouro,
+            'endereco_numero': _na_to_none(contract.endereco_numero),
+            'endereco_bairro': contract.endereco_bairro,
+            'endereco_cidade': contract.endereco_cidade,
+            'endereco_complemento': _na_to_none(contract.endereco_complemento),
+            'endereco_cep': contract.endereco_cep,
+            'endereco_uf': contract.endereco_uf,
+            'status': self.statuses.ids[contract.status],
+            'hash_conteudo': contract.hash_conteudo
         }
 
+    def _bulk_process_clients(self, clients, stats=None):
+        """Insert clients and their contacts in batches, reusing the ones already stored.
+        Returns the ids of these clients"""
+        stats = self.stats if stats is None else stats
+        with profiler.stage("load_clients", len(clients)):
+            client_ids = self._existing_client_ids(clients)
+            stats["clients_existed"] += len(client_ids)
+
+            new_clients = [self._get_client_data(c) for c in clients if c.cpf_cnpj not in client_ids]
+            for batch in chunked(new_clients, self.batch_size):
+                inserted = Cliente.insert_many(batch).returning(Cliente.cpf_cnpj, Cliente.id).tuples().execute()
+                client_ids.update(inserted)
+                stats["clients_inserted"] += len(batch)
+
+        self._insert_contacts(clients, client_ids, stats)
+        return client_ids
+
+    @staticmethod
+    def _existing_client_ids(clients):
+        """cpf_cnpj -> id of the clients already stored, in one query"""
+        cpf_cnpjs = [client.cpf_cnpj for client in clients]
+        return dict(Cliente
+                    .select(Cliente.cpf_cnpj, Cliente.id)
+                    .where(Cliente.cpf_cnpj == fn.ANY(Value(cpf_cnpjs, converter=False, unpack=False)))
+                    .tuples())
+
+    def _insert_contacts(self, clients, client_ids, stats):
+        with profiler.stage("load_contacts") as stage:
+            contacts = self._contact_data(clients, client_ids)
+            stage.rows = len(contacts)
+            for batch in chunked(contacts, self.batch_size):
+                # The (cliente, tipo_contato, contato) unique index skips contacts already stored
+                inserted = (ClienteContato
+                            .insert_many(batch)
+                            .on_conflict_ignore()
+                            .returning(ClienteContato.id)
+                            .tuples()
+                            .execute())
+                stats["contacts_inserted"] += len(list(inserted))
+
+    def _contact_data(self, clients, client_ids):
+        contacts = []
+        for client in clients:
+            for contact in client.contatos:
+                type_id = self.contact_types.get(contact.tipo)
+                if type_id is not None:
+                    contacts.append({
+                        'cliente': client_ids[client.cpf_cnpj],
+                        'tipo_contato': type_id,
+                        'contato': contact.contato
+                    })
+        return contacts
+
+    def _bulk_process_plans(self, contracts):
+        """Map every (descricao, valor) pair to a plan id, creating the missing ones at once"""
+        with profiler.stage("load_plans", len(contracts)):
+            inserted = self.plans.inserted
+            plan_ids = self.plans.resolve(self._plan_key(c.plano_descricao, c.plano_valor) for c in contracts)
+            self.stats["plans_inserted"] += self.plans.inserted - inserted
+        return plan_ids
+
+    @classmethod
+    def plan_cache(cls, batch_size=1000):
+        return DimensionCache(Plano, (Plano.descricao, Plano.valor), key=cls._plan_key,
+                              insert_missing=True, batch_size=batch_size)
+
+    @staticmethod
+    def _plan_key(descricao, valor):
+        # Plano.valor comes back as a Decimal with 2 places, the sheet gives floats
+        return (descricao, round(float(valor), 2))
+
+    def _bulk_process_contracts(self, contracts, client_ids, plan_ids=None, stats=None):
+        stats = self.stats if stats is None else stats
+        contracts = [c for c in contracts if c.cliente_cpf_cnpj in client_ids]
+        if plan_ids is None:
+            plan_ids = self._bulk_process_plans(contracts)
+
+        with profiler.stage("load_contracts", len(contracts)):
+            rows = [
+                {
+                    'cliente': client_ids[contract.cliente_cpf_cnpj],
+                    'plano': plan_ids[self._plan_key(contract.plano_descricao, contract.plano_valor)],
+                    **self._get_contract_data(contract)
+                }
+                for contract in contracts
+            ]
+            for batch in chunked(rows, self.batch_size):
+                ClienteContrato.insert_many(batch).as_rowcount().execute()
+                stats["contracts_inserted"] += len(batch)
+            self.summary.add(rows)
+
+class CopyLoader(DataLoader):
+    """Loads through COPY FROM STDIN into unlogged staging tables, then resolves
+    foreign keys with set-based INSERT ... SELECT into the real tables"""
+
+    STAGING_TABLES = {
+        "stg_clientes": (
+            "nome_razao_social", "nome_fantasia", "cpf_cnpj", "data_nascimento", "data_cadastro"
+        ),
+        "stg_cliente_contatos": ("cpf_cnpj", "tipo_contato", "contato"),
+        "stg_cliente_contratos": (
+            "cpf_cnpj", "plano_descricao", "plano_valor", "status", "dia_vencimento", "isento",
+            "endereco_logradouro", "endereco_numero", "endereco_bairro", "endereco_cidade",
+            "endereco_complemento", "endereco_cep", "endereco_uf", "hash_conteudo"
+        )
+    }
+    STAGING_TYPES = {
+        "data_nascimento": "date", "data_cadastro": "timestamp", "plano_valor": "numeric(15,2)",
+        "dia_vencimento": "integer", "isento": "boolean"
+    }
+
+    def _write(self, clients, contracts):
+        with db.atomic():
+            self._bulk_process_plans(contracts)
+            with profiler.stage("load_copy", len(clients) + len(contracts)):
+                self._prepare_staging()
+                self._copy("stg_clientes", self._client_rows(clients))
+                self._copy("stg_cliente_contatos", self._contact_rows(clients))
+                self._copy("stg_cliente_contratos", self._contract_rows(contracts))
+            with profiler.stage("load_merge", len(contracts)):
+                self._merge_staging(len(clients))
+                # Staging only holds the rows in flight, not a copy of the last sheet's clients
+                self._truncate_staging()
+
+    def _prepare_staging(self):
+        for table, columns in self.STAGING_TABLES.items():
+            definition = ", ".join(f"{col} {self.STAGING_TYPES.get(col, 'text')}" for col in columns)
+            db.execute_sql(f"CREATE UNLOGGED TABLE IF NOT EXISTS {table} ({definition})")
+        self._truncate_staging()
+
+    def _truncate_staging(self):
+        db.execute_sql(f"TRUNCATE {', '.join(self.STAGING_TABLES)}")
+
+    def _copy(self, table, rows):
+        columns = ", ".join(self.STAGING_TABLES[table])
+        sql = f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        # COPY goes around execute_sql, so it is counted here
+        with profiler.query(), db.cursor() as cursor:
+            cursor.copy_expert(sql, _CsvStream(rows))
+
+    def _client_rows(self, clients):
+        for client in clients:
+            data = self._get_client_data(client)
+            yield [data[col] for col in self.STAGING_TABLES["stg_clientes"]]
+
+    def _contact_rows(self, clients):
+        for client in clients:
+            for contact in client.contatos:
+                yield [client.cpf_cnpj, contact.tipo, contact.contato]
+
+    def _contract_rows(self, contracts):
+        for contract in contracts:
+            yield [
+                contract.cliente_cpf_cnpj, contract.plano_descricao, contract.plano_valor,
+                contract.status, contract.dia_vencimento, contract.isento,
+                contract.endereco_logradouro, contract.endereco_numero,
+                contract.endereco_bairro, contract.endereco_cidade,
+                contract.endereco_complemento, contract.endereco_cep, contract.endereco_uf,
+                contract.hash_conteudo
+            ]
+
+    def _merge_staging(self, clients_total):
+        inserted = db.execute_sql("""
+            INSERT INTO tbl_clientes (nome_razao_social, nome_fantasia, cpf_cnpj, data_nascimento, data_cadastro)
+            SELECT nome_razao_social, nome_fantasia, cpf_cnpj, data_nascimento, data_cadastro
+            FROM stg_clientes
+            ON CONFLICT (cpf_cnpj) DO NOTHING
+        """).rowcount
+        self.stats["clients_inserted"] += inserted
+        self.stats["clients_existed"] += clients_total - inserted
+
+        self.stats["contacts_inserted"] += db.execute_sql("""
+            INSERT INTO tbl_cliente_contatos (cliente_id, tipo_contato_id, contato)
+            SELECT c.id, t.id, s.contato
+            FROM stg_cliente_contatos s
+            JOIN tbl_clientes c ON c.cpf_cnpj = s.cpf_cnpj
+            JOIN tbl_tipos_contato t ON t.tipo_contato = s.tipo_contato
+            ON CONFLICT (cliente_id, tipo_contato_id, contato) DO NOTHING
+        """).rowcount
+
+        # Plans and statuses were already resolved by the caches before the COPY.
+        # Only the per profile counts of the inserted contracts come back, for the summary
+        profiles = db.execute_sql("""
+            WITH inserted AS (
+                INSERT INTO tbl_cliente_contratos (
+                    cliente_id, plano_id, status_id, dia_vencimento, isento,
+                    endereco_logradouro, endereco_numero, endereco_bairro, endereco_cidade,
+                    endereco_complemento, endereco_cep, endereco_uf, hash_conteudo
+                )
+                SELECT
+                    c.id, p.id, st.id, s.dia_vencimento, s.isento,
+                    s.endereco_logradouro, s.endereco_numero, s.endereco_bairro, s.endereco_cidade,
+                    s.endereco_complemento, s.endereco_cep, s.endereco_uf, s.hash_conteudo
+                FROM stg_cliente_contratos s
+                JOIN tbl_clientes c ON c.cpf_cnpj = s.cpf_cnpj
+                JOIN tbl_planos p ON p.descricao = s.plano_descricao AND p.valor = s.plano_valor
+                JOIN tbl_status_contrato st ON st.status = s.status
+                RETURNING status_id, plano_id, endereco_uf, endereco_cidade, isento
+            )
+            SELECT status_id, plano_id, endereco_uf, endereco_cidade, isento, count(*)
+            FROM inserted
+            GROUP BY status_id, plano_id, endereco_uf, endereco_cidade, isento
+        """).fetchall()
+        self.summary.add_counts((row[:-1], row[-1]) for row in profiles)
+        self.stats["contracts_inserted"] += sum(row[-1] for row in profiles)
+
+class IncrementalLoader(DataLoader):
+    """Applies only the difference between the sheet and the database, in one transaction.
+    Clients are upserted on cpf_cnpj, contacts are insert-only and contracts are matched
+    by their content hash: unmatched stored contracts are updated in place when the same
+    client got a new one, deleted otherwise"""
+
+    CLIENT_FIELDS = (Cliente.nome_razao_social, Cliente.nome_fantasia, Cliente.data_nascimento, Cliente.data_cadastro)
+
+    def __init__(self, db_constants, batch_size=1000, **options):
+        super().__init__(db_constants, bulk=True, batch_size=batch_size)
+        self.stats.update({
+            "clients_updated": 0, "clients_unchanged": 0,
+            "contracts_updated": 0, "contracts_unchanged": 0, "contracts_deleted": 0
+        })
+
+    def load_delta(self, clients, contracts, removed_hashes, dropped_records):
+        """Load only the rows that changed since the last import. Stored contracts are
+        never matched or deleted unless their hash is listed in removed_hashes"""
+        return self._load(clients, contracts, dropped_records,
+                          partial(self._write, candidates=Counter(removed_hashes)))
+
+    def _write(self, clients, contracts, candidates=None):
+        with db.atomic():
+            client_ids = self._upsert_clients(clients)
+            self._sync_contracts(contracts, client_ids, candidates)
+
+    def _upsert_clients(self, clients):
+        with profiler.stage("load_clients", len(clients)):
+            client_ids = self.client_ids
+            client_ids.update(self._existing_client_ids(clients))
+
+            rows = [self._get_client_data(client) for client in clients]
+            changed = Expression(
+                Tuple(*self.CLIENT_FIELDS), 'IS DISTINCT FROM',
+                Tuple(*[getattr(EXCLUDED, field.name) for field in self.CLIENT_FIELDS])
+            )
+            for batch in chunked(rows, self.batch_size):
+                # Only inserted or really changed rows come back, xmax = 0 tells them apart
+                written = (Cliente
+                           .insert_many(batch)
+                           .on_conflict(conflict_target=[Cliente.cpf_cnpj], preserve=self.CLIENT_FIELDS, where=changed)
+                           .returning(Cliente.cpf_cnpj, Cliente.id, SQL('xmax = 0'))
+                           .tuples()
+                           .execute())
+                for cpf_cnpj, client_id, inserted in written:
+                    client_ids[cpf_cnpj] = client_id
+                    self.stats["clients_inserted" if inserted else "clients_updated"] += 1
+
+            self.stats["clients_unchanged"] = (self.stats["clients_total"] - self.stats["clients_inserted"]
+                                               - self.stats["clients_updated"])
+            self.stats["clients_existed"] = self.stats["clients_updated"] + self.stats["clients_unchanged"]
+
+        self._insert_contacts(clients, client_ids, self.stats)
+        return client_ids
+
+    def _sync_contracts(self, contracts, client_ids, candidates=None):
+        with profiler.stage("match_contracts", len(contracts)):
+            # Stored contracts grouped by hash, each sheet row consumes one matching id
+            stored = defaultdict(list)
+            stored_client = {}
+            query = ClienteContrato.select(ClienteContrato.id, ClienteContrato.hash_conteudo, ClienteContrato.cliente)
+            if candidates is not None:
+                query = query.where(ClienteContrato.hash_conteudo.in_(list(candidates)))
+            for contract_id, content_hash, client_id in query.tuples().iterator():
+                if candidates is not None and len(stored[content_hash]) >= candidates[content_hash]:
+                    continue
+                stored[content_hash].append(contract_id)
+                stored_client[contract_id] = client_id
+
+            new_contracts = []
+            for contract in contracts:
+                if contract.cliente_cpf_cnpj not in client_ids:
+                    continue
+                if stored.get(contract.hash_conteudo):
+                    stored[contract.hash_conteudo].pop()
+                    self.stats["contracts_unchanged"] += 1
+                else:
+                    new_contracts.append(contract)
+
+            # Leftover stored contracts of a client are reused for that client's new contracts
+            leftovers = defaultdict(list)
+            for ids in stored.values():
+                for contract_id in ids:
+                    leftovers[stored_client[contract_id]].append(contract_id)
+
+        plan_ids = self._bulk_process_plans(new_contracts)
+        with profiler.stage("load_contracts", len(new_contracts)):
+            inserts, updates, updated_rows = [], [], []
+            for contract in new_contracts:
+                client_id = client_ids[contract.cliente_cpf_cnpj]
+                data = {
+                    'cliente': client_id,
+                    'plano': plan_ids[self._plan_key(contract.plano_descricao, contract.plano_valor)],
+                    **self._get_contract_data(contract)
+                }
+                if leftovers.get(client_id):
+                    updates.append(ClienteContrato(id=leftovers[client_id].pop(), **data))
+                    updated_rows.append(data)
+                else:
+                    inserts.append(data)
+
+            removed = [contract_id for ids in leftovers.values() for contract_id in ids]
+            # What gets overwritten or deleted leaves the summary as it was stored
+            self.summary.remove([contract.id for contract in updates] + removed)
+            self.summary.add(inserts + updated_rows)
+
+            for batch in chunked(inserts, self.batch_size):
+                ClienteContrato.insert_many(batch).as_rowcount().execute()
+                self.stats["contracts_inserted"] += len(batch)
+
+            if updates:
+                fields = [f for f in ClienteContrato._meta.sorted_fields if f is not ClienteContrato.id]
+                ClienteContrato.bulk_update(updates, fields=fields, batch_size=self.batch_size)
+                self.stats["contracts_updated"] += len(updates)
+
+            for batch in chunked(removed, self.batch_size):
+                ClienteContrato.delete().where(ClienteContrato.id.in_(batch)).execute()
+                self.stats["contracts_deleted"] += len(batch)
+
+class AsyncLoader(DataLoader):
+    """Writes disjoint client chunks concurrently, each with its contacts and contracts,
+    on pooled connections. Plans are resolved first so chunks never race on them.
+    At most `concurrency` chunks are in flight, the next one is only built when a slot frees up.
+
+    Each chunk commits on its own transaction instead of one transaction for the whole load"""
+
+    def __init__(self, db_constants, batch_size=1000, concurrency=4, **options):
+        super().__init__(db_constants, bulk=True, batch_size=batch_size)
+        self.concurrency = concurrency
+
+    def _write(self, clients, contracts):
+        asyncio.run(self._write_async(clients, contracts))
+
+    async def _write_async(self, clients, contracts):
+        plan_ids = self._bulk_process_plans(contracts)
+
+        contracts_by_client = defaultdict(list)
+        for contract in contracts:
+            contracts_by_client[contract.cliente_cpf_cnpj].append(contract)
+
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.concurrency)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            async def write(func, *args):
+                try:
+                    return await loop.run_in_executor(executor, func, *args)
+                finally:
+                    slots.release()
+
+            tasks = []
+            for batch in chunked(clients, self.batch_size):
+                await slots.acquire()
+                batch_contracts = [c for client in batch for c in contracts_by_client.pop(client.cpf_cnpj, [])]
+                tasks.append(asyncio.create_task(write(self._write_chunk, batch, batch_contracts, plan_ids)))
+            results = await asyncio.gather(*tasks)
+
+            for client_ids, stats in results:
+                self._merge_chunk(client_ids, stats)
+
+            # Contracts of clients loaded by an earlier load_data call
+            leftovers = [c for client_contracts in contracts_by_client.values() for c in client_contracts]
+            # Every client is in by now, the batches only read this one copy
+            client_ids, tasks = dict(self.client_ids), []
+            for batch in chunked(leftovers, self.batch_size):
+                await slots.acquire()
+                tasks.append(asyncio.create_task(write(self._write_contracts, batch, client_ids, plan_ids)))
+            for stats in await asyncio.gather(*tasks):
+                self._merge_chunk({}, stats)
+
+    def _write_chunk(self, clients, contracts, plan_ids):
+        stats = Counter()
+        with db.connection_context(), db.atomic():
+            client_ids = self._bulk_process_clients(clients, stats)
+            self._bulk_process_contracts(contracts, client_ids, plan_ids, stats)
+        return client_ids, stats
+
+    def _write_contracts(self, contracts, client_ids, plan_ids):
+        stats = Counter()
+        with db.connection_context(), db.atomic():
+            self._bulk_process_contracts(contracts, client_ids, plan_ids, stats)
+        return stats
+
+    def _merge_chunk(self, client_ids, stats):
+        self.client_ids.update(client_ids)
+        for key, value in stats.items():
+            self.stats[key] += value
+
+class PartitionedLoader(DataLoader):
+    """Splits the clients on a hash of cpf_cnpj into `partitions` disjoint sets and writes each
+    one, with its contacts and contracts, in its own transaction on its own pooled connection.
+    Every write is keyed by client, so partitions never wait on each other's rows; plans are
+    resolved before the workers start so none of them race on Plano.descricao"""
+
+    def __init__(self, db_constants, batch_size=1000, partitions=4, **options):
+        super().__init__(db_constants, bulk=True, batch_size=batch_size)
+        self.partitions = partitions
+
+    def partition(self, cpf_cnpj):
+        # crc32 rather than hash(), which changes from one interpreter to the next
+        return zlib.crc32(cpf_cnpj.encode()) % self.partitions
+
+    def _write(self, clients, contracts):
+        plan_ids = self._bulk_process_plans(contracts)
+
+        client_parts = [[] for _ in range(self.partitions)]
+        contract_parts = [[] for _ in range(self.partitions)]
+        for client in clients:
+            client_parts[self.partition(client.cpf_cnpj)].append(client)
+        for contract in contracts:
+            contract_parts[self.partition(contract.cliente_cpf_cnpj)].append(contract)
+
+        with ThreadPoolExecutor(max_workers=self.partitions) as executor:
+            results = list(executor.map(self._write_partition, client_parts, contract_parts,
+                                        [plan_ids] * self.partitions))
+        for client_ids, stats in results:
+            self.client_ids.update(client_ids)
+            for key, value in stats.items():
+                self.stats[key] += value
+
+    def _write_partition(self, clients, contracts, plan_ids):
+        stats = Counter()
+        with db.connection_context(), db.atomic():
+            client_ids = self._bulk_process_clients(clients, stats)
+            # Chunked imports also carry contracts of clients loaded by an earlier chunk,
+            # self.client_ids is only read until every partition is done
+            self._bulk_process_contracts(contracts, {**self.client_ids, **client_ids}, plan_ids, stats)
+        return client_ids, stats
+
+class _CsvStream:
+    """File-like object that COPY reads from, rendering CSV lines only as they are requested"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+
+    def read(self, size=-1):
+        while size < 0 or self._buffer.tell() < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow([self._value(v) for v in row])
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+    @staticmethod
+    def _value(value):
+        if value is None or (not isinstance(value, str) and pd.isna(value)):
+            return "\\N"
+        return value
+
 def print_import_summary(stats):
     print("\n===== IMPORT SUMMARY =====")
     print(f"Total clients processed: {stats['clients_total']}")
@@ -101,20 +645,21 @@ def print_import_summary(stats):
     print(f"Contracts inserted: {stats['contracts_inserted']}")
     print(f"Plans created: {stats['plans_inserted']}")
     
-    total_dropped = sum(len(r) for r in stats['dropped_records'].values())
+    dropped = stats['dropped_records']
+    total_dropped = dropped.total()
     if total_dropped > 0:
         print(f"\n{total_dropped} records could not be processed:")
-        for category, records in stats['dropped_records'].items():
-            if records:
-                print(f"\n- {category.replace('_', ' ').title()} ({len(records)} records):")
+        for category, count in dropped.counts.items():
+            if count:
+                print(f"\n- {category.replace('_', ' ').title()} ({count} records):")
                 
-                # Print first 5 records
-                for i, record in enumerate(records[:5], 1):
-                    identifier = record['data'].get('CPF/CNPJ', 'Unknown') or \
-                               record['data'].get('Nome/Razão Social', 'Unknown')
-                    print(f"  {i}. {identifier}: {record['reason']}")
+                # Print the sampled records
+                records = dropped.samples.get(category, [])
+                for i, record in enumerate(records, 1):
+                    identifier = record.identifier or 'Unknown'
+                    print(f"  {i}. {identifier}: {record.reason}")
                 
-                # Show remaining count if there are more than 5
-                if len(records) > 5:
-                    remaining = len(records) - 5
+                # Show remaining count if there are more than the sample
+                if count > len(records):
+                    remaining = count - len(records)
                     print(f"  ... and {remaining} more")
\ No newline at end of file
@@ -0,0 +1,132 @@
+import hashlib
+import json
+from collections import defaultdict
+from datetime import datetime
+import pandas as pd
+from peewee import chunked
+from .database import db, CheckpointImportacao, Importacao, ImportacaoLinha
+from .records import Record
+from .rejects import DroppedRecords
+
+def file_hash(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def row_hashes(df):
+    """Hash of each raw sheet row, ignoring its position and cell types"""
+    values = df.astype(str).where(df.notna(), "")
+    return pd.util.hash_pandas_object(values, index=False).map("{:016x}".format)
+
+class ImportManifest:
+    """Remembers what each import read and produced, so an identical file returns the
+    previous stats and a partially changed one only goes through the changed rows.
+
+    Only the latest import keeps its per-row hashes, they describe what is in the database now."""
+
+    def __init__(self, file_path):
+        self.file_path = str(file_path)
+        self.file_hash = file_hash(file_path)
+        self.last = Importacao.select().order_by(Importacao.id.desc()).first()
+
+    def cached_stats(self):
+        """Stats of the last import when it read exactly this file"""
+        if self.last is None or self.last.hash_arquivo != self.file_hash:
+            return None
+        return load_stats(self.last.estatisticas)
+
+    def has_rows(self):
+        return self.last is not None and self.last.linhas.exists()
+
+    def diff(self, hashes):
+        """Split the sheet rows against the last import.
+        Returns the indices of rows to process, the content hash of every kept row
+        and the content hashes of the contracts whose rows disappeared"""
+        previous = defaultdict(list)
+        query = (ImportacaoLinha
+                 .select(ImportacaoLinha.hash_linha, ImportacaoLinha.hash_conteudo)
+                 .where(ImportacaoLinha.importacao == self.last)
+                 .tuples())
+        for row_hash, content_hash in query.iterator():
+            previous[row_hash].append(content_hash)
+
+        changed, kept = [], {}
+        for idx, row_hash in hashes.items():
+            if previous.get(row_hash):
+                kept[idx] = previous[row_hash].pop()
+            else:
+                changed.append(idx)
+
+        removed = [h for content_hashes in previous.values() for h in content_hashes if h is not None]
+        return changed, kept, removed
+
+    def record(self, stats, rows=None):
+        """Store the run. rows are (row hash, contract content hash or None) pairs"""
+        with db.atomic():
+            importacao = Importacao.create(
+                arquivo=self.file_path,
+                hash_arquivo=self.file_hash,
+                estatisticas=json.dumps(stats, default=_json_default),
+                data_importacao=datetime.now()
+            )
+            # Whatever an interrupted chunked import left behind was just replaced or changed
+            CheckpointImportacao.delete().execute()
+            if rows is not None:
+                ImportacaoLinha.delete().execute()
+                fields = [ImportacaoLinha.importacao, ImportacaoLinha.hash_linha, ImportacaoLinha.hash_conteudo]
+                for batch in chunked(((importacao.id, *row) for row in rows), 5000):
+                    ImportacaoLinha.insert_many(batch, fields=fields).as_rowcount().execute()
+        self.last = importacao
+
+class ImportCheckpoint:
+    """Progress of a chunked import, saved in the same transaction as each chunk it loads:
+    rows of the sheet already consumed and the stats up to there. An import that stopped
+    halfway can carry on from its checkpoint instead of starting over. Only unfinished imports
+    have one, a finished import is recorded by ImportManifest"""
+
+    def __init__(self, file_path, file_hash):
+        self.file_path = str(file_path)
+        self.file_hash = file_hash
+        self.current = None
+
+    def interrupted(self):
+        """Checkpoint of this exact file, None when there is nothing to resume"""
+        self.current = (CheckpointImportacao
+                        .select()
+                        .where(CheckpointImportacao.hash_arquivo == self.file_hash)
+                        .order_by(CheckpointImportacao.id.desc())
+                        .first())
+        return self.current
+
+    def stats(self):
+        return load_stats(self.current.estatisticas) if self.current.estatisticas else None
+
+    def start(self, chunk_size):
+        """New checkpoint for a run starting from the first row"""
+        self.current = CheckpointImportacao.create(
+            arquivo=self.file_path,
+            hash_arquivo=self.file_hash,
+            tamanho_chunk=chunk_size,
+            atualizado_em=datetime.now()
+        )
+
+    def save(self, rows, stats):
+        self.current.linhas = rows
+        self.current.estatisticas = json.dumps(stats, default=_json_default)
+        self.current.atualizado_em = datetime.now()
+        self.current.save()
+
+    def finish(self):
+        self.current.delete_instance()
+        self.current = None
+
+def load_stats(data):
+    """Stats stored as JSON, with their dropped records turned back into DroppedRecords"""
+    stats = json.loads(data)
+    stats["dropped_records"] = DroppedRecords.from_dict(stats.get("dropped_records", {}))
+    return stats
+
+def _json_default(value):
+    return value.as_dict() if isinstance(value, (Record, DroppedRecords)) else str(value)
@@ -0,0 +1,202 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+# Applied in order and recorded in tbl_migracoes. Statements are idempotent, so a
+# database restored from a newer data/dump.sql goes through them unchanged
+MIGRATIONS = [
+    (1, "Content hash of each contract", [
+        "ALTER TABLE tbl_cliente_contratos ADD COLUMN IF NOT EXISTS hash_conteudo varchar(16)",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_hash_conteudo ON tbl_cliente_contratos (hash_conteudo)"
+    ]),
+    (2, "Import manifest", [
+        """CREATE TABLE IF NOT EXISTS tbl_importacoes (
+            id bigserial PRIMARY KEY,
+            arquivo varchar(500) NOT NULL,
+            hash_arquivo varchar(64) NOT NULL,
+            estatisticas text NOT NULL,
+            data_importacao timestamp NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS tbl_importacoes_hash_arquivo ON tbl_importacoes (hash_arquivo)",
+        """CREATE TABLE IF NOT EXISTS tbl_importacao_linhas (
+            id bigserial PRIMARY KEY,
+            importacao_id bigint NOT NULL REFERENCES tbl_importacoes(id) ON DELETE CASCADE,
+            hash_linha varchar(16) NOT NULL,
+            hash_conteudo varchar(16)
+        )""",
+        "CREATE INDEX IF NOT EXISTS tbl_importacao_linhas_importacao_id ON tbl_importacao_linhas (importacao_id)"
+    ]),
+    (3, "Foreign key and filter indexes for the loader and viewer", [
+        # tbl_cliente_contatos.cliente_id is already the leading column of its unique key
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contatos_tipo_contato_id ON tbl_cliente_contatos (tipo_contato_id)",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_cliente_id ON tbl_cliente_contratos (cliente_id)",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_plano_id ON tbl_cliente_contratos (plano_id)",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_status_id ON tbl_cliente_contratos (status_id)",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_endereco_uf ON tbl_cliente_contratos (endereco_uf)",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_endereco_cidade ON tbl_cliente_contratos (lower(endereco_cidade))",
+        "CREATE INDEX IF NOT EXISTS tbl_cliente_contratos_isento ON tbl_cliente_contratos (id) WHERE isento"
+    ]),
+    (4, "Contract aggregates for the dashboard", [
+        # Filled on the first dashboard or import, see src/summary.py
+        """CREATE TABLE IF NOT EXISTS tbl_resumo_contratos (
+            dimensao varchar(20) NOT NULL,
+            chave varchar(300) NOT NULL,
+            contratos bigint NOT NULL DEFAULT 0,
+            isentos bigint NOT NULL DEFAULT 0,
+            mrr numeric(15,2) NOT NULL DEFAULT 0,
+            clientes bigint,
+            PRIMARY KEY (dimensao, chave)
+        )"""
+    ]),
+    (5, "Log of the files picked up by serve", [
+        """CREATE TABLE IF NOT EXISTS tbl_log_importacoes (
+            id bigserial PRIMARY KEY,
+            arquivo varchar(500) NOT NULL,
+            importacao_id bigint REFERENCES tbl_importacoes(id) ON DELETE SET NULL,
+            situacao varchar(20) NOT NULL,
+            erro text,
+            inicio timestamp NOT NULL,
+            duracao_s numeric(12,3) NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS tbl_log_importacoes_inicio ON tbl_log_importacoes (inicio)"
+    ]),
+    (6, "Checkpoints of chunked imports", [
+        """CREATE TABLE IF NOT EXISTS tbl_importacao_checkpoints (
+            id bigserial PRIMARY KEY,
+            arquivo varchar(500) NOT NULL,
+            hash_arquivo varchar(64) NOT NULL,
+            tamanho_chunk integer NOT NULL,
+            linhas bigint NOT NULL DEFAULT 0,
+            estatisticas text,
+            atualizado_em timestamp NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS tbl_importacao_checkpoints_hash_arquivo ON tbl_importacao_checkpoints (hash_arquivo)"
+    ]),
+    (7, "Rejected sheet rows", [
+        """CREATE TABLE IF NOT EXISTS tbl_registros_rejeitados (
+            id bigserial PRIMARY KEY,
+            arquivo varchar(500) NOT NULL,
+            hash_arquivo varchar(64) NOT NULL,
+            categoria varchar(50) NOT NULL,
+            linha bigint,
+            identificador text,
+            motivo text
+        )""",
+        "CREATE INDEX IF NOT EXISTS tbl_registros_rejeitados_hash_arquivo ON tbl_registros_rejeitados (hash_arquivo)"
+    ]),
+    (8, "Client search indexes", [
+        # Both extensions are trusted, the database owner can create them
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        # unaccent() is only stable, it can't be used in an index without an immutable wrapper
+        """CREATE OR REPLACE FUNCTION normalizar_busca(text) RETURNS text
+            LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+            AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1)) $$""",
+        """CREATE INDEX IF NOT EXISTS tbl_clientes_nome_razao_social_trgm
+            ON tbl_clientes USING gin (normalizar_busca(nome_razao_social) gin_trgm_ops)""",
+        """CREATE INDEX IF NOT EXISTS tbl_clientes_nome_fantasia_trgm
+            ON tbl_clientes USING gin (normalizar_busca(nome_fantasia) gin_trgm_ops)""",
+        """CREATE INDEX IF NOT EXISTS tbl_cliente_contatos_contato_trgm
+            ON tbl_cliente_contatos USING gin (normalizar_busca(contato) gin_trgm_ops)""",
+        # CPF/CNPJ prefixes are typed with or without punctuation, the digits are indexed
+        """CREATE INDEX IF NOT EXISTS tbl_clientes_cpf_cnpj_digitos
+            ON tbl_clientes (regexp_replace(cpf_cnpj, '\\D', '', 'g') text_pattern_ops)"""
+    ]),
+    (9, "Indexes dropped for a bulk load", [
+        # pid is the backend that dropped them, rows of a backend that is gone were never rebuilt
+        """CREATE TABLE IF NOT EXISTS tbl_indices_adiados (
+            nome varchar(255) PRIMARY KEY,
+            tabela varchar(255) NOT NULL,
+            definicao text NOT NULL,
+            pid integer NOT NULL
+        )"""
+    ])
+]
+
+def _ensure_migrations_table(database):
+    database.execute_sql("""
+        CREATE TABLE IF NOT EXISTS tbl_migracoes (
+            versao integer PRIMARY KEY,
+            descricao varchar(255) NOT NULL,
+            aplicada_em timestamp NOT NULL
+        )
+    """)
+
+def applied_versions(database):
+    exists = database.execute_sql("SELECT to_regclass('tbl_migracoes') IS NOT NULL").fetchone()[0]
+    if not exists:
+        return set()
+    return {row[0] for row in database.execute_sql("SELECT versao FROM tbl_migracoes")}
+
+def pending_migrations(database):
+    applied = applied_versions(database)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+def apply_migrations(database):
+    """Apply every pending migration, each one in its own transaction. Returns the versions applied"""
+    _ensure_migrations_table(database)
+    applied = []
+    for version, description, statements in pending_migrations(database):
+        with database.atomic():
+            for sql in statements:
+                database.execute_sql(sql)
+            database.execute_sql(
+                "INSERT INTO tbl_migracoes (versao, descricao, aplicada_em) VALUES (%s, %s, %s)",
+                (version, description, datetime.now())
+            )
+        applied.append(version)
+    return applied
+
+# The backend that recorded the row is gone, it died before rebuilding the index
+_ORPHANED = "pid NOT IN (SELECT pid FROM pg_stat_activity WHERE pid IS NOT NULL)"
+
+@contextmanager
+def deferred_indexes(database, tables):
+    """Drop the non-unique indexes of tables for the duration of a bulk load and rebuild them
+    afterwards, even if the load fails. Unique and primary key indexes are kept, the loaders
+    rely on them for ON CONFLICT. The tables are analyzed at the end, stale row counts from
+    before a big load make the planner pick nested loops over sequential scans.
+
+    The dropped indexes are recorded in tbl_indices_adiados in the same transaction, so a load
+    killed before the rebuild leaves them to restore_indexes. Indexes an earlier killed load
+    left dropped on these tables are rebuilt here too"""
+    with database.atomic():
+        indexes = database.execute_sql("""
+            SELECT i.relname, t.relname, pg_get_indexdef(x.indexrelid)
+            FROM pg_index x
+            JOIN pg_class i ON i.oid = x.indexrelid
+            JOIN pg_class t ON t.oid = x.indrelid
+            WHERE t.relname = ANY(%s) AND NOT x.indisunique AND NOT x.indisprimary
+        """, (list(tables),)).fetchall()
+        for name, table, definition in indexes:
+            database.execute_sql(
+                "INSERT INTO tbl_indices_adiados (nome, tabela, definicao, pid) VALUES (%s, %s, %s, pg_backend_pid()) "
+                "ON CONFLICT (nome) DO UPDATE SET definicao = excluded.definicao, pid = excluded.pid",
+                (name, table, definition)
+            )
+            database.execute_sql(f'DROP INDEX IF EXISTS "{name}"')
+        indexes += database.execute_sql(f"""
+            UPDATE tbl_indices_adiados SET pid = pg_backend_pid()
+            WHERE tabela = ANY(%s) AND {_ORPHANED}
+            RETURNING nome, tabela, definicao
+        """, (list(tables),)).fetchall()
+    try:
+        yield [name for name, _, _ in indexes]
+    finally:
+        _rebuild_indexes(database, indexes, tables)
+
+def restore_indexes(database):
+    """Rebuild the indexes of loads that were killed (signal, out of memory, lost connection)
+    between deferred_indexes dropping and rebuilding them. Returns their names"""
+    indexes = database.execute_sql(
+        f"SELECT nome, tabela, definicao FROM tbl_indices_adiados WHERE {_ORPHANED}").fetchall()
+    _rebuild_indexes(database, indexes, {table for _, table, _ in indexes})
+    return [name for name, _, _ in indexes]
+
+def _rebuild_indexes(database, indexes, tables):
+    for name, _, definition in indexes:
+        # Each index is forgotten together with its rebuild, a crash halfway leaves the rest recorded
+        with database.atomic():
+            database.execute_sql(definition.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1))
+            database.execute_sql("DELETE FROM tbl_indices_adiados WHERE nome = %s", (name,))
+    for table in sorted(tables):
+        database.execute_sql(f"ANALYZE {table}")
@@ -1,27 +1,91 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
 import pandas as pd
 from .logger import logger
-from .helpers import check_cpf, state_to_uf, normalize_text
+from .profiler import profiler
+from .helpers import validate_cpf_cnpj, states_to_uf, normalize_text
+from .reader import read_sheet, iter_sheet_chunks
+from .records import Client, Contact, Contract, DroppedRecord, intern_values
+from .rejects import DroppedRecords, ListRejectSink
+from .rules import FieldRules
 
 class DataProcessor:
-    def __init__(self):
-        self.dropped_records = {
-            "missing_data": [],
-            "invalid_cpf": [],
-            "other_errors": []
-        }
+    def __init__(self, rejects=None, rules=None):
+        # Counters and a sample of the rejected rows, the rows themselves go to the rejects sink
+        self.dropped_records = DroppedRecords(rejects)
+        self.rules = rules or FieldRules()
+        # CPF/CNPJs already extracted, so clients spread over several chunks are kept once
+        self.seen_clients = set()
+        # Sheet rows consumed by iter_chunks, including the ones dropped
+        self.rows_read = 0
 
     def preprocess_data(self, file_path):
         try:
-            df = pd.read_excel(file_path)
-            df = self._validate_required_columns(df)
-            if df is not None:
-                df = self._clean_data(df)
-            return df
+            return self.preprocess_frame(read_sheet(file_path))
         except Exception as e:
             logger.error(e)
-            self.dropped_records["other_errors"].append({"reason": str(e)})
+            self.dropped_records.add("other_errors", [DroppedRecord(reason=str(e))])
             return None
 
+    def preprocess_frame(self, df):
+        """Same as preprocess_data, for rows already read from the sheet"""
+        try:
+            return self._preprocess(df)
+        except Exception as e:
+            logger.error(e)
+            self.dropped_records.add("other_errors", [DroppedRecord(reason=str(e))])
+            return None
+
+    def _preprocess(self, df):
+        df = self._validate_required_columns(df)
+        if df is not None:
+            df = self._clean_data(df)
+        return df
+
+    def iter_chunks(self, file_path, chunk_size, start=0):
+        """Pre-process the sheet chunk by chunk, so memory depends on chunk_size and not on file size.
+        Starts after the first start rows, rows_read tells where the chunk just yielded ends.
+        Errors are raised, not recorded: the chunks already loaded must not pass for the whole sheet"""
+        self.rows_read = start
+        chunks = iter_sheet_chunks(file_path, chunk_size, start)
+        while True:
+            with profiler.stage("read") as stage:
+                chunk = next(chunks, None)
+                stage.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                break
+            self.rows_read += len(chunk)
+            df = self._validate_required_columns(chunk)
+            if not df.empty:
+                yield self._clean_data(df)
+
+    def process_parallel(self, df, workers):
+        """Pre-process and extract raw sheet rows on several processes.
+        Returns clients, contracts and the contract content hash of each row, like the
+        sequential path: the first occurrence of a CPF/CNPJ wins and dropped records keep sheet order"""
+        bounds = np.linspace(0, len(df), workers + 1, dtype=int)
+        partitions = [df.iloc[start:end] for start, end in zip(bounds, bounds[1:]) if end > start]
+
+        clients, contracts, hashes = [], [], []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map keeps partition order, which keeps the merge deterministic
+            results = pool.map(_process_partition, partitions, repeat(self.rules.rules))
+            for client_rows, contract_rows, content_hashes, dropped, rule_stats in results:
+                for row in client_rows:
+                    if row[2] not in self.seen_clients:
+                        self.seen_clients.add(row[2])
+                        clients.append(Client(*row[:-1], [Contact(*contact) for contact in row[-1]]))
+                # Pickle memoizes the interned strings, so they are still shared once unpickled
+                contracts.extend(Contract(*row) for row in contract_rows)
+                hashes.append(content_hashes)
+                for category, record in dropped:
+                    self.dropped_records.add(category, [DroppedRecord(*record)])
+                self.rules.update(rule_stats)
+
+        content_hashes = pd.concat(hashes) if hashes else pd.Series(dtype=object)
+        return clients, contracts, content_hashes
+
     def _validate_required_columns(self, df):
         required_cols = [
             "Nome/Razão Social", "CPF/CNPJ", "Data Cadastro cliente",
@@ -29,111 +93,167 @@ class DataProcessor:
             "Status", "Plano Valor", "Plano"
         ]
         
-        # Create mask of valid rows
-        valid_mask = pd.Series(True, index=df.index)
-        for col in required_cols:
-            col_mask = df[col].notna()
-            invalid_rows = df[~col_mask]
-            
-            if not invalid_rows.empty:
-                self._add_dropped_records(invalid_rows, f"Missing required value: {col}")
-                valid_mask &= col_mask
+        with profiler.stage("validate", len(df)):
+            # Create mask of valid rows
+            valid_mask = pd.Series(True, index=df.index)
+            for col in required_cols:
+                col_mask = df[col].notna()
+                invalid_rows = df[~col_mask]
 
-        return df[valid_mask].copy()  # Ensure we return a copy
+                if not invalid_rows.empty:
+                    self._add_dropped_records(invalid_rows, f"Missing required value: {col}", "missing_data")
+                    valid_mask &= col_mask
+
+            return df[valid_mask]
 
     def _clean_data(self, df):
-        df = df.copy()  # Work on a clean copy to avoid SettingWithCopyWarning
-        df = self._filter_invalid_cpfs(df)
-        
-        # Convert NaT to None for date fields
-        df.loc[:, "Data Nasc."] = df["Data Nasc."].where(pd.notna(df["Data Nasc."]), None)
-        df.loc[:, "Isento"] = df["Isento"].str.lower() == "sim"
-        df.loc[:, "Plano Valor"] = df["Plano Valor"].astype(float)
-        df.loc[:, "UF"] = df["UF"].apply(state_to_uf)
-        
+        df = self._filter_invalid_cpfs(df)  # Returns a copy, safe to assign on
+
+        with profiler.stage("validate_fields", len(df)):
+            df, rejections = self.rules.apply(df)
+            for reason, rows in rejections:
+                self._add_dropped_records(rows, reason, "invalid_data")
+
+        with profiler.stage("clean", len(df)):
+            # Convert NaT to None for date fields
+            df.loc[:, "Data Nasc."] = df["Data Nasc."].where(pd.notna(df["Data Nasc."]), None)
+            df.loc[:, "Isento"] = df["Isento"].astype(str).str.lower() == "sim"
+            df.loc[:, "Plano Valor"] = df["Plano Valor"].astype(float)
+            df.loc[:, "UF"] = states_to_uf(df["UF"])
+
         return df
 
     def _filter_invalid_cpfs(self, df):
-        invalid_mask = ~df["CPF/CNPJ"].astype(str).apply(check_cpf)
-        invalid_rows = df[invalid_mask]
-        
-        if not invalid_rows.empty:
-            self._add_dropped_records(invalid_rows, "Invalid CPF/CNPJ format")
-        
-        return df[~invalid_mask].copy()
+        with profiler.stage("validate_cpf", len(df)):
+            valid_mask, canonical = validate_cpf_cnpj(df["CPF/CNPJ"])
+            invalid_rows = df[~valid_mask]
 
-    def _add_dropped_records(self, df_rows, reason):
-        for _, row in df_rows.iterrows():
-            self.dropped_records["missing_data"].append({
-                "reason": reason,
-                "data": row.to_dict()
-            })
+            if not invalid_rows.empty:
+                self._add_dropped_records(invalid_rows, "Invalid CPF/CNPJ format", "invalid_cpf")
+
+            # Same document typed with or without punctuation must dedup to one client
+            df = df[valid_mask].copy()
+            df["CPF/CNPJ"] = canonical[valid_mask]
+            return df
+
+    def _add_dropped_records(self, df_rows, reason, category):
+        # Only the row number and something to identify it by, never a copy of the row
+        identifiers = df_rows["CPF/CNPJ"].where(df_rows["CPF/CNPJ"].notna(), df_rows["Nome/Razão Social"])
+        self.dropped_records.add(category, (
+            DroppedRecord(row, identifier, reason)
+            for row, identifier in zip(df_rows.index.tolist(), identifiers.tolist())
+        ))
 
     def extract_clients(self, df):
-        """Extract client data from dataframe"""
-        clients = {}
-        
-        for _, row in df.iterrows():
-            cpf_cnpj = str(row["CPF/CNPJ"])
-            
-            if cpf_cnpj not in clients:
-                clients[cpf_cnpj] = {
-                    "nome_razao_social": row["Nome/Razão Social"],
-                    "nome_fantasia": row.get("Nome Fantasia", ""),
-                    "cpf_cnpj": cpf_cnpj,
-                    "data_nascimento": row.get("Data Nasc.", None),
-                    "data_cadastro": row["Data Cadastro cliente"],
-                    "contatos": self._extract_contacts(row)
-                }
-        
-        return list(clients.values())
+        """Extract client data from dataframe, the first row of each CPF/CNPJ wins"""
+        with profiler.stage("extract_clients", len(df)):
+            firsts = df.drop_duplicates("CPF/CNPJ")
+            firsts = firsts[~firsts["CPF/CNPJ"].astype(str).isin(self.seen_clients)]
+            cpf_cnpjs = firsts["CPF/CNPJ"].astype(str).tolist()
+            contacts = self._extract_contacts(firsts, cpf_cnpjs)
 
-    def _extract_contacts(self, row):
-        """Extract contact information from a row"""
-        contacts = []
+            clients = [
+                Client(nome, fantasia, cpf_cnpj, nascimento, cadastro, contacts.get(cpf_cnpj, []))
+                for nome, fantasia, cpf_cnpj, nascimento, cadastro in zip(
+                    firsts["Nome/Razão Social"].tolist(),
+                    self._column(firsts, "Nome Fantasia", ""),
+                    cpf_cnpjs,
+                    self._column(firsts, "Data Nasc.", None),
+                    firsts["Data Cadastro cliente"].tolist()
+                )
+            ]
+
+            self.seen_clients.update(cpf_cnpjs)
+            return clients
+
+    def _extract_contacts(self, df, cpf_cnpjs):
+        """Extract contact information from every row at once, grouped by CPF/CNPJ"""
         contact_types = {
-            "Celular": "Celulares",
-            "Telefone": "Telefones", 
-            "E-Mail": "Emails"
+            "Celulares": "Celular",
+            "Telefones": "Telefone", 
+            "Emails": "E-Mail"
         }
-        
-        for tipo, col in contact_types.items():
-            if pd.notna(row.get(col, pd.NA)):
-                contact_value = str(row[col])
-                # Remove decimal part if it's a phone number
-                if tipo in ["Celular", "Telefone"]:
-                    contact_value = contact_value.split('.')[0]
-                contacts.append({
-                    "tipo": tipo,
-                    "contato": contact_value
-                })
-        
+        columns = [col for col in contact_types if col in df]
+        if not columns:
+            return {}
+
+        melted = (df[columns]
+                  .assign(cpf_cnpj=cpf_cnpjs)
+                  .melt(id_vars="cpf_cnpj", var_name="coluna", value_name="contato", ignore_index=False)
+                  .dropna(subset=["contato"])
+                  .sort_index(kind="stable"))  # Back to row order, keeping the column order inside a row
+
+        # Phone numbers read as floats were turned back into digits by the field rules
+        values = melted["contato"].astype(str)
+
+        contacts = {}
+        for cpf_cnpj, col, value in zip(melted["cpf_cnpj"].tolist(), melted["coluna"].tolist(), values.tolist()):
+            contacts.setdefault(cpf_cnpj, []).append(Contact(contact_types[col], value))
         return contacts
 
     def extract_contracts(self, df, clients):
         """Extract contract data from dataframe"""
-        contracts = []
-        client_cpf_cnpjs = {c["cpf_cnpj"] for c in clients}
-        
-        for _, row in df.iterrows():
-            cpf_cnpj = str(row["CPF/CNPJ"])
-            if cpf_cnpj in client_cpf_cnpjs:
-                contracts.append({
-                    "cliente_cpf_cnpj": cpf_cnpj,
-                    "dia_vencimento": int(row["Vencimento"]),
-                    "isento": bool(row.get("Isento", False)),
-                    "endereco_logradouro": row["Endereço"],
-                    "endereco_numero": row.get("Número", ""),
-                    "endereco_bairro": row["Bairro"],
-                    "endereco_cidade": row["Cidade"],
-                    "endereco_complemento": row.get("Complemento", ""),
-                    "endereco_cep": row["CEP"],
-                    "endereco_uf": row["UF"],
-                    "status": row["Status"],
-                    "plano": {
-                        "descricao": row["Plano"],
-                        "valor": float(row["Plano Valor"])
-                    }
-                })
-        
-        return contracts
\ No newline at end of file
+        with profiler.stage("extract_contracts", len(df)):
+            client_cpf_cnpjs = {c.cpf_cnpj for c in clients} | self.seen_clients
+            cpf_cnpjs = df["CPF/CNPJ"].astype(str)
+            df = df[cpf_cnpjs.isin(client_cpf_cnpjs)]
+
+            columns = zip(
+                cpf_cnpjs[df.index].tolist(),
+                self.contract_hashes(df).tolist(),
+                df["Vencimento"].astype(int).tolist(),
+                self._column(df, "Isento", False),
+                df["Endereço"].tolist(),
+                self._column(df, "Número", ""),
+                intern_values(df["Bairro"].tolist()),
+                intern_values(df["Cidade"].tolist()),
+                self._column(df, "Complemento", ""),
+                df["CEP"].tolist(),
+                intern_values(df["UF"].tolist()),
+                intern_values(df["Status"].tolist()),
+                intern_values(df["Plano"].tolist()),
+                df["Plano Valor"].astype(float).tolist()
+            )
+            return [
+                Contract(cpf_cnpj, content_hash, vencimento, bool(isento), logradouro, numero, bairro,
+                         cidade, complemento, cep, uf, status, plano, valor)
+                for (cpf_cnpj, content_hash, vencimento, isento, logradouro, numero, bairro,
+                     cidade, complemento, cep, uf, status, plano, valor) in columns
+            ]
+
+    @staticmethod
+    def _column(df, col, default):
+        """Column values as a list, or default for every row when the sheet doesn't have it"""
+        return df[col].tolist() if col in df else [default] * len(df)
+
+    def contract_hashes(self, df):
+        """Stable content hash of each contract row, used to find what changed between imports"""
+        columns = [
+            "CPF/CNPJ", "Plano", "Status", "Vencimento", "Isento", "Endereço",
+            "Número", "Bairro", "Cidade", "Complemento", "CEP", "UF"
+        ]
+        values = pd.DataFrame({
+            col: df[col].where(df[col].notna(), "").astype(str) if col in df else ""
+            for col in columns
+        }, index=df.index)
+        values["Plano Valor"] = df["Plano Valor"].map("{:.2f}".format)
+        return pd.util.hash_pandas_object(values, index=False).map("{:016x}".format)
+
+def _process_partition(df, rules):
+    """Worker side of process_parallel. Records go back as plain tuples, which pickle smaller"""
+    rejects = ListRejectSink()
+    processor = DataProcessor(rejects, FieldRules(rules))
+    # Errors are raised, pool.map hands them to the parent: a partition must never load as empty
+    df = processor._preprocess(df)
+    clients = processor.extract_clients(df)
+    contracts = processor.extract_contracts(df, clients)
+    hashes = processor.contract_hashes(df)
+
+    client_rows = [
+        client.as_tuple()[:-1] + (tuple(contact.as_tuple() for contact in client.contatos),)
+        for client in clients
+    ]
+    contract_rows = [contract.as_tuple() for contract in contracts]
+    processor.dropped_records.flush()
+    dropped = [(category, record.as_tuple()) for category, record in rejects.records]
+    return client_rows, contract_rows, hashes, dropped, processor.rules.stats
@@ -0,0 +1,261 @@
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from .logger import logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class StageTiming:
+    """What one pipeline stage cost, summed over every time it ran (chunks, threads)"""
+    __slots__ = ("name", "calls", "rows", "wall", "cpu", "peak_rss", "queries", "query_time")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = self.rows = self.queries = 0
+        self.wall = self.cpu = self.query_time = 0.0
+        self.peak_rss = 0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "calls": self.calls,
+            "rows": self.rows,
+            "wall_s": round(self.wall, 6),
+            "cpu_s": round(self.cpu, 6),
+            "rows_per_s": round(self.rows / self.wall, 1) if self.rows and self.wall else None,
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1) if self.peak_rss else None,
+            "queries": self.queries,
+            "query_s": round(self.query_time, 6)
+        }
+
+class _Rows:
+    __slots__ = ("rows", "peak_rss")
+
+    def __init__(self, rows=None):
+        self.rows = rows
+        self.peak_rss = 0
+
+class Profiler:
+    """Per-stage wall time, CPU time, rows/sec, peak RSS and database round trips.
+    Disabled by default, every stage() is then a no-op.
+
+    CPU time is per thread, so stages run by several loader threads add up. Peak RSS
+    is the most memory the process held while the stage ran, stages running at the same
+    time see the same peak. That needs the kernel high-water mark to be reset, on other
+    systems than Linux it is the process peak so far when the stage ended"""
+
+    OTHER = "other"
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.hot_stage = None
+        self.tool = "cprofile"
+        self._hot = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._database = None
+        self._started = None
+        self._running = []
+        self._peak_rss = 0
+
+    def enable(self, database=None, hot_stage=None, tool="cprofile"):
+        """Start recording. database gets its execute_sql wrapped to count queries"""
+        self.enabled = True
+        self.hot_stage = hot_stage
+        self.tool = tool
+        self._started = (time.perf_counter(), time.process_time())
+        if database is not None:
+            self._attach(database)
+
+    def reset(self):
+        """Forget every stage recorded so far and restart the totals"""
+        self.stages = {}
+        self._hot = None
+        self._started = (time.perf_counter(), time.process_time())
+        with self._lock:
+            _rss_high_water()
+            self._peak_rss = 0
+
+    def disable(self):
+        self.enabled = False
+        if self._database is not None:
+            del self._database.execute_sql
+            self._database = None
+
+    def _attach(self, database):
+        execute_sql = database.execute_sql
+
+        def timed_execute_sql(*args, **kwargs):
+            with self.query():
+                return execute_sql(*args, **kwargs)
+
+        database.execute_sql = timed_execute_sql
+        self._database = database
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _timing(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageTiming(name)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Time the block as stage `name`. Set .rows on the yielded object when the row
+        count is only known at the end"""
+        counter = _Rows(rows)
+        if not self.enabled:
+            yield counter
+            return
+
+        stack = self._stack()
+        stack.append(name)
+        hot = self._start_hot(name)
+        with self._lock:
+            self._fold_rss()
+            self._running.append(counter)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield counter
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+            if hot:
+                self._stop_hot()
+            stack.pop()
+            with self._lock:
+                self._fold_rss()
+                self._running.remove(counter)
+                timing = self._timing(name)
+                timing.calls += 1
+                timing.rows += counter.rows or 0
+                timing.wall += wall
+                timing.cpu += cpu
+                timing.peak_rss = max(timing.peak_rss, counter.peak_rss)
+
+    def _fold_rss(self):
+        # Under self._lock: the peak since the last fold counts for every stage running now
+        peak = _rss_high_water()
+        self._peak_rss = max(self._peak_rss, peak)
+        for counter in self._running:
+            counter.peak_rss = max(counter.peak_rss, peak)
+
+    @contextmanager
+    def query(self):
+        """Count the block as one database round trip of the current stage"""
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack = self._stack()
+            with self._lock:
+                timing = self._timing(stack[-1] if stack else self.OTHER)
+                timing.queries += 1
+                timing.query_time += elapsed
+
+    def _start_hot(self, name):
+        # The profilers only follow the thread that started them
+        if name != self.hot_stage or threading.current_thread() is not threading.main_thread():
+            return False
+        if self._hot is None:
+            if self.tool == "pyinstrument":
+                try:
+                    from pyinstrument import Profiler as Instrument
+                except ImportError as e:
+                    raise ImportError("--profile-tool pyinstrument requires pyinstrument (pip install pyinstrument)") from e
+                self._hot = Instrument()
+            else:
+                import cProfile
+                self._hot = cProfile.Profile()
+        if self.tool == "pyinstrument":
+            self._hot.start()
+        else:
+            self._hot.enable()
+        return True
+
+    def _stop_hot(self):
+        if self.tool == "pyinstrument":
+            self._hot.stop()
+        else:
+            self._hot.disable()
+
+    def report(self):
+        wall = time.perf_counter() - self._started[0] if self._started else 0.0
+        cpu = time.process_time() - self._started[1] if self._started else 0.0
+        # Queries outside any stage (connection setup, manifest lookups) are listed last
+        timings = sorted(self.stages.values(), key=lambda timing: timing.name == self.OTHER)
+        stages = [timing.as_dict() for timing in timings]
+        with self._lock:
+            self._fold_rss()
+        return {
+            "stages": stages,
+            "total": {
+                "wall_s": round(wall, 6),
+                "cpu_s": round(cpu, 6),
+                "peak_rss_mb": round(self._peak_rss / 2**20, 1) if self._peak_rss else None,
+                "queries": sum(s["queries"] for s in stages),
+                "query_s": round(sum(s["query_s"] for s in stages), 6)
+            }
+        }
+
+    def write(self, path):
+        """Write the JSON report to path and the hot stage dump next to it, returns the report"""
+        report = self.report()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Profile report written to {path}")
+
+        if self._hot is not None:
+            base = str(path).rsplit(".", 1)[0]
+            if self.tool == "pyinstrument":
+                dump = f"{base}-{self.hot_stage}.html"
+                with open(dump, "w") as f:
+                    f.write(self._hot.output_html())
+            else:
+                dump = f"{base}-{self.hot_stage}.prof"
+                self._hot.dump_stats(dump)
+            logger.info(f"Profile of stage {self.hot_stage} written to {dump}")
+        elif self.hot_stage:
+            logger.warning(f"Stage {self.hot_stage} never ran, nothing to dump")
+        return report
+
+_resettable = sys.platform.startswith("linux")
+
+def _rss_high_water():
+    """Peak RSS in bytes since the previous call on Linux, where reading restarts the kernel
+    high-water mark from the current RSS. The process peak so far elsewhere"""
+    global _resettable
+    if _resettable:
+        try:
+            with open("/proc/self/status", "rb") as f:
+                peak = int(re.search(rb"VmHWM:\s+(\d+)", f.read()).group(1)) * 1024
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            return peak
+        except (OSError, AttributeError):
+            _resettable = False
+    return _peak_rss()
+
+def _peak_rss():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    return peak if sys.platform == "darwin" else peak * 1024
+
+profiler = Profiler()
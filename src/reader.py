@@ -0,0 +1,76 @@
+from pathlib import Path
+import pandas as pd
+from .writers import require_pyarrow
+
+DATE_COLUMNS = ["Data Nasc.", "Data Cadastro cliente"]
+TEXT_COLUMNS = {"CPF/CNPJ": str, "CEP": str, "Número": str}
+
+def read_sheet(file_path):
+    """Read the whole sheet (xlsx, csv or parquet) into a single DataFrame"""
+    suffix = Path(file_path).suffix.lower()
+    if suffix == ".csv":
+        return pd.read_csv(file_path, dtype=TEXT_COLUMNS, parse_dates=DATE_COLUMNS)
+    if suffix == ".parquet":
+        return pd.read_parquet(file_path)
+    return pd.read_excel(file_path)
+
+def iter_sheet_chunks(file_path, chunk_size, start=0):
+    """Yield DataFrames of at most chunk_size rows, indexed by their row number in the file.
+    The first start rows are skipped without being turned into DataFrames"""
+    suffix = Path(file_path).suffix.lower()
+    if suffix == ".csv":
+        chunks = pd.read_csv(file_path, dtype=TEXT_COLUMNS, parse_dates=DATE_COLUMNS, chunksize=chunk_size,
+                             skiprows=range(1, start + 1))
+    elif suffix == ".parquet":
+        chunks = _iter_parquet(file_path, chunk_size, start)
+    else:
+        chunks = _iter_xlsx(file_path, chunk_size, start)
+
+    offset = start
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+def _iter_xlsx(file_path, chunk_size, start=0):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            if start:
+                start -= 1
+                continue
+            batch.append(row)
+            if len(batch) == chunk_size:
+                yield _xlsx_frame(batch, header)
+                batch = []
+        if batch:
+            yield _xlsx_frame(batch, header)
+    finally:
+        workbook.close()
+
+def _xlsx_frame(rows, header):
+    df = pd.DataFrame(rows, columns=header)
+    for col in DATE_COLUMNS:
+        if col in df:
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+def _iter_parquet(file_path, chunk_size, start=0):
+    _, pq = require_pyarrow("Reading parquet files in chunks")
+
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+        if start >= batch.num_rows:
+            start -= batch.num_rows
+            continue
+        yield batch.slice(start).to_pandas()
+        start = 0
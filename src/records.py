@@ -0,0 +1,48 @@
+import sys
+
+class Record:
+    """Base for the rows passed from DataProcessor to the loaders. Slots keep each
+    instance to a fixed set of pointers, without the per-instance dict"""
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        for field, value in zip(self.__slots__, args):
+            setattr(self, field, value)
+        for field, value in kwargs.items():
+            setattr(self, field, value)
+
+    def as_tuple(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_tuple() == other.as_tuple()
+
+    def __repr__(self):
+        values = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+class Contact(Record):
+    __slots__ = ("tipo", "contato")
+
+class Client(Record):
+    __slots__ = ("nome_razao_social", "nome_fantasia", "cpf_cnpj", "data_nascimento", "data_cadastro", "contatos")
+
+class Contract(Record):
+    __slots__ = (
+        "cliente_cpf_cnpj", "hash_conteudo", "dia_vencimento", "isento", "endereco_logradouro",
+        "endereco_numero", "endereco_bairro", "endereco_cidade", "endereco_complemento",
+        "endereco_cep", "endereco_uf", "status", "plano_descricao", "plano_valor"
+    )
+
+class DroppedRecord(Record):
+    __slots__ = ("row", "identifier", "reason")
+
+    def __init__(self, row=None, identifier=None, reason=None):
+        super().__init__(row, identifier, reason)
+
+def intern_values(values):
+    """Share one string object per distinct value, for low-cardinality columns"""
+    return [sys.intern(v) if type(v) is str else v for v in values]
@@ -0,0 +1,146 @@
+from pathlib import Path
+import pandas as pd
+from .database import RegistroRejeitado
+from .records import DroppedRecord
+from .writers import open_writer
+
+CATEGORIES = ("missing_data", "invalid_cpf", "invalid_data", "other_errors")
+# Records of each category kept in memory for the import summary
+SAMPLE_SIZE = 5
+COLUMNS = ("categoria", "linha", "identificador", "motivo")
+FILE_COLUMNS = [("categoria", "string"), ("linha", "int64"), ("identificador", "string"), ("motivo", "string")]
+
+class DroppedRecords:
+    """Rows rejected during an import. Only a count per category and its first SAMPLE_SIZE
+    records stay in memory, every record is handed to the sink, when there is one, in batches.
+
+    Used as a context manager around the import: pending records are only flushed when it
+    succeeds, a table sink must not keep the rejects of a chunk that was rolled back"""
+
+    def __init__(self, sink=None, batch_size=5000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        self.samples = {category: [] for category in CATEGORIES}
+        self.pending = []
+
+    def add(self, category, records):
+        samples = self.samples.setdefault(category, [])
+        count = 0
+        for record in records:
+            count += 1
+            if len(samples) < SAMPLE_SIZE:
+                samples.append(record)
+            if self.sink is not None:
+                self.pending.append((category, record))
+                if len(self.pending) >= self.batch_size:
+                    self.flush()
+        self.counts[category] = self.counts.get(category, 0) + count
+
+    def update(self, other):
+        """Add the counts and samples of other, e.g. the ones checkpointed by an interrupted import"""
+        for category, count in other.counts.items():
+            samples = self.samples.setdefault(category, [])
+            samples.extend(other.samples.get(category, [])[:SAMPLE_SIZE - len(samples)])
+            self.counts[category] = self.counts.get(category, 0) + count
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def flush(self):
+        if self.pending:
+            self.sink.write(self.pending)
+            self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.sink is not None:
+            if exc_type is None:
+                self.flush()
+            self.pending = []
+            self.sink.close()
+
+    def as_dict(self):
+        return {
+            "counts": self.counts,
+            "samples": {category: [record.as_dict() for record in records] for category, records in self.samples.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if "counts" not in data:
+            # Stats stored before the counters, with every record listed per category
+            data = {"counts": {category: len(records) for category, records in data.items()}, "samples": data}
+        dropped = cls()
+        dropped.counts.update(data["counts"])
+        dropped.samples.update({
+            category: [DroppedRecord(**record) for record in records[:SAMPLE_SIZE]]
+            for category, records in data["samples"].items()
+        })
+        return dropped
+
+def open_rejects(kind, directory, file_path, file_hash, start=0):
+    """Sink for --rejects: a csv or parquet file named after the sheet in directory, or the
+    rejects table. A resumed import (start > 0) writes a file of its own, parquet can't be appended to"""
+    if kind == "table":
+        return TableRejectSink(file_path, file_hash, keep=bool(start))
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    resumed = f".from-{start}" if start else ""
+    path = directory / f"{Path(file_path).stem}.rejects{resumed}.{kind}"
+    return FileRejectSink(path, kind)
+
+def _text(value):
+    return None if value is None else str(value)
+
+class ListRejectSink:
+    """Keeps every record, for the processes of DataProcessor.process_parallel"""
+
+    def __init__(self):
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+    def close(self):
+        pass
+
+class FileRejectSink:
+    """Every batch is appended to a csv or parquet file, as a row group for parquet"""
+
+    def __init__(self, path, fmt):
+        self.writer = open_writer(fmt, path, FILE_COLUMNS)
+
+    def write(self, records):
+        rows = [(category, r.row, _text(r.identifier), r.reason) for category, r in records]
+        df = pd.DataFrame.from_records(rows, columns=COLUMNS).astype({"linha": "Int64"})
+        self.writer.write(df)
+
+    def close(self):
+        self.writer.close()
+
+class TableRejectSink:
+    """Rows go to tbl_registros_rejeitados on the import's own connection, so the rejects of a
+    chunked import commit or roll back with their chunk. A new import of the same file replaces
+    the rows of the previous one, a resumed import keeps them"""
+
+    FIELDS = (RegistroRejeitado.arquivo, RegistroRejeitado.hash_arquivo, RegistroRejeitado.categoria,
+              RegistroRejeitado.linha, RegistroRejeitado.identificador, RegistroRejeitado.motivo)
+
+    def __init__(self, file_path, file_hash, keep=False):
+        self.file_path = str(file_path)
+        self.file_hash = file_hash
+        if not keep:
+            RegistroRejeitado.delete().where(RegistroRejeitado.hash_arquivo == file_hash).execute()
+
+    def write(self, records):
+        rows = [
+            (self.file_path, self.file_hash, category, r.row, _text(r.identifier), r.reason)
+            for category, r in records
+        ]
+        RegistroRejeitado.insert_many(rows, fields=self.FIELDS).as_rowcount().execute()
+
+    def close(self):
+        pass
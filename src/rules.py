@@ -0,0 +1,138 @@
+import json
+import time
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_float_dtype
+
+EMAIL_PATTERN = r"[^@\s]+@[^@\s]+\.[^@\s]+"
+
+# Rules used when no config is given. reject drops the row, clear only empties the value:
+# a bad contact or birth date isn't a reason to lose the client and its contracts
+DEFAULT_RULES = [
+    {"column": "CEP", "check": "cep", "on_invalid": "reject"},
+    {"column": "Vencimento", "check": "integer", "min": 1, "max": 31, "on_invalid": "reject"},
+    {"column": "Data Cadastro cliente", "check": "date", "min": "1900-01-01", "max": "today", "on_invalid": "reject"},
+    {"column": "Data Nasc.", "check": "date", "min": "1900-01-01", "max": "today", "on_invalid": "clear"},
+    {"column": "Celulares", "check": "phone", "on_invalid": "clear"},
+    {"column": "Telefones", "check": "phone", "on_invalid": "clear"},
+    {"column": "Emails", "check": "email", "max_length": 255, "on_invalid": "clear"}
+]
+
+def _digits(values):
+    """Only the digits of each value, numbers read as floats (5511483992889.0) included"""
+    if is_float_dtype(values):
+        return values.astype("int64").astype(str)
+    return values.astype(str).str.replace(r"\.0$", "", regex=True).str.replace(r"\D", "", regex=True)
+
+def check_cep(values):
+    digits = _digits(values)
+    # A CEP read as a number loses its leading zero, no CEP starts with two
+    valid = digits.str.len().isin((7, 8))
+    digits = digits.str.zfill(8)
+    return digits.str[:5] + "-" + digits.str[5:], valid
+
+def check_phone(values, min_digits=10, max_digits=13):
+    """Area code and number, with or without the 55 country code"""
+    digits = _digits(values)
+    return digits, digits.str.len().between(min_digits, max_digits)
+
+def check_email(values, max_length=255):
+    # Only trimmed, the pattern doesn't depend on case and the address is stored as the client gave it
+    emails = values.astype(str).str.strip()
+    return emails, emails.str.fullmatch(EMAIL_PATTERN) & (emails.str.len() <= max_length)
+
+def check_integer(values, min=None, max=None):
+    numbers = pd.to_numeric(values, errors="coerce")
+    valid = numbers.notna() & (numbers == numbers.round())
+    if min is not None:
+        valid &= numbers >= min
+    if max is not None:
+        valid &= numbers <= max
+    return numbers.where(valid, 0).astype("int64"), valid
+
+def check_date(values, min=None, max=None):
+    dates = values if is_datetime64_any_dtype(values) else pd.to_datetime(values, errors="coerce", format="mixed")
+    valid = dates.notna()
+    if min is not None:
+        valid &= dates >= _timestamp(min)
+    if max is not None:
+        valid &= dates <= _timestamp(max)
+    return dates, valid
+
+def _timestamp(value):
+    return pd.Timestamp.now() if value == "today" else pd.Timestamp(value)
+
+# check name -> function(non-null values, **options) returning the normalized values and a validity mask
+CHECKS = {
+    "cep": check_cep,
+    "phone": check_phone,
+    "email": check_email,
+    "integer": check_integer,
+    "date": check_date
+}
+
+class FieldRules:
+    """Declarative field validation. Each rule checks one column of the whole chunk at once with
+    vectorized string/regex operations, and in the same pass replaces its values with their
+    normalized form. Empty values are left to the required columns check.
+
+    Rules are dicts: column, check (a key of CHECKS), on_invalid (reject or clear) and the options
+    of the check. Checked and invalid values and the time spent are counted per rule"""
+
+    def __init__(self, rules=None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+        for rule in self.rules:
+            if rule.get("check") not in CHECKS:
+                raise ValueError(f"Unknown check {rule.get('check')!r} on column {rule.get('column')!r}")
+            if rule.get("on_invalid", "reject") not in ("reject", "clear"):
+                raise ValueError(f"on_invalid must be reject or clear, not {rule['on_invalid']!r}")
+        # rule name -> {"checked", "invalid", "seconds"}
+        self.stats = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def name(rule):
+        return f"{rule['column']}: {rule['check']}"
+
+    def apply(self, df):
+        """Normalize df in place. Returns its rows that passed every reject rule, and the
+        (reason, rows) rejected by each rule, every row under the first rule it failed"""
+        rejected = pd.Series(False, index=df.index)
+        rejections = []
+        for rule in self.rules:
+            column = rule["column"]
+            if column not in df:
+                continue
+            start = time.perf_counter()
+            options = {k: v for k, v in rule.items() if k not in ("column", "check", "on_invalid")}
+            present = df[column].notna()
+            values, valid = CHECKS[rule["check"]](df.loc[present, column], **options)
+            # String checks can give object masks. Rows left empty aren't invalid
+            valid = valid.astype("boolean").fillna(False).astype(bool)
+            invalid = ~valid.reindex(df.index, fill_value=True)
+
+            normalized = values.reindex(df.index)
+            if rule.get("on_invalid", "reject") == "clear":
+                df[column] = normalized.where(~invalid, None)
+            else:
+                df[column] = normalized
+                first = invalid & ~rejected
+                if first.any():
+                    rejections.append((f"Invalid value: {column}", df[first]))
+                rejected |= invalid
+
+            counts = self.stats.setdefault(self.name(rule), {"checked": 0, "invalid": 0, "seconds": 0.0})
+            counts["checked"] += int(present.sum())
+            counts["invalid"] += int(invalid.sum())
+            counts["seconds"] += time.perf_counter() - start
+        return df[~rejected], rejections
+
+    def update(self, stats):
+        """Add counts of the same rules, from other processes or a checkpointed import"""
+        for name, counts in stats.items():
+            total = self.stats.setdefault(name, {"checked": 0, "invalid": 0, "seconds": 0.0})
+            for key, value in counts.items():
+                total[key] += value
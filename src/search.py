@@ -0,0 +1,86 @@
+import re
+from .database import db
+
+# Shorter terms have no trigram to look up in the indexes, they would read every row
+MIN_TERM_LENGTH = 3
+
+# Each branch finds (cliente_id, score) candidates through one of the indexes of migration 8.
+# Names match a fragment anywhere (LIKE) or a word close to the term (%>, typos),
+# both answered by the trigram indexes, and are ranked by word similarity
+NAME_BRANCH = """
+    SELECT id, greatest(
+        word_similarity(normalizar_busca(%(term)s), normalizar_busca(nome_razao_social)),
+        word_similarity(normalizar_busca(%(term)s), normalizar_busca(nome_fantasia))
+    )
+    FROM tbl_clientes
+    WHERE normalizar_busca(nome_razao_social) LIKE normalizar_busca(%(pattern)s)
+       OR normalizar_busca(nome_fantasia) LIKE normalizar_busca(%(pattern)s)
+       OR normalizar_busca(nome_razao_social) %%> normalizar_busca(%(term)s)
+"""
+DOCUMENT_BRANCH = """
+    SELECT id, 1.0 FROM tbl_clientes WHERE regexp_replace(cpf_cnpj, '\\D', '', 'g') LIKE %(prefix)s
+"""
+CONTACT_BRANCH = """
+    SELECT cliente_id, similarity(normalizar_busca(%(contact)s), normalizar_busca(contato))
+    FROM tbl_cliente_contatos
+    WHERE normalizar_busca(contato) LIKE normalizar_busca(%(contact_pattern)s)
+"""
+
+# Best clients with their contacts and contracts, all in one round trip
+SEARCH_SQL = """
+    WITH candidatos (cliente_id, score) AS ({branches}),
+    ranking AS (
+        SELECT cliente_id, max(score) AS score
+        FROM candidatos
+        GROUP BY cliente_id
+        ORDER BY score DESC, cliente_id
+        LIMIT %(limit)s
+    )
+    SELECT r.score, c.id, c.nome_razao_social, c.nome_fantasia, c.cpf_cnpj,
+        (SELECT coalesce(json_agg(json_build_object('tipo', t.tipo_contato, 'contato', ct.contato) ORDER BY ct.id), '[]')
+         FROM tbl_cliente_contatos ct
+         JOIN tbl_tipos_contato t ON t.id = ct.tipo_contato_id
+         WHERE ct.cliente_id = c.id),
+        (SELECT coalesce(json_agg(json_build_object(
+                    'id', k.id, 'plano', p.descricao, 'valor', p.valor, 'status', s.status,
+                    'dia_vencimento', k.dia_vencimento, 'cidade', k.endereco_cidade, 'uf', k.endereco_uf
+                ) ORDER BY k.id), '[]')
+         FROM tbl_cliente_contratos k
+         JOIN tbl_planos p ON p.id = k.plano_id
+         JOIN tbl_status_contrato s ON s.id = k.status_id
+         WHERE k.cliente_id = c.id)
+    FROM ranking r
+    JOIN tbl_clientes c ON c.id = r.cliente_id
+    ORDER BY r.score DESC, c.id
+"""
+
+def _escape_like(text):
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_query(query, limit=20):
+    """SQL and parameters searching query. A query made of digits and punctuation is looked up
+    as a CPF/CNPJ prefix and a phone, anything else as part of a name or a contact (e-mail).
+    Returns None when the query is too short to search"""
+    query = query.strip()
+    digits = re.sub(r"\D", "", query)
+    params = {"limit": limit}
+    if re.fullmatch(r"[\d\s().+/-]+", query):
+        if len(digits) < MIN_TERM_LENGTH:
+            return None
+        branches = [DOCUMENT_BRANCH, CONTACT_BRANCH]
+        params.update(prefix=f"{digits}%", contact=digits, contact_pattern=f"%{digits}%")
+    else:
+        if len(query) < MIN_TERM_LENGTH:
+            return None
+        branches = [NAME_BRANCH, CONTACT_BRANCH]
+        pattern = f"%{_escape_like(query)}%"
+        params.update(term=query, pattern=pattern, contact=query, contact_pattern=pattern)
+    return SEARCH_SQL.format(branches=" UNION ALL ".join(branches)), params
+
+def search_clients(query, limit=20):
+    """Clients best matching query, with their contacts and contracts"""
+    search = search_query(query, limit)
+    if search is None:
+        return []
+    columns = ("score", "id", "nome_razao_social", "nome_fantasia", "cpf_cnpj", "contatos", "contratos")
+    return [dict(zip(columns, row)) for row in db.execute_sql(*search).fetchall()]
@@ -0,0 +1,163 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+from threading import Lock
+from peewee import EXCLUDED, chunked, fn
+from .database import *
+
+# dimensao of the single row holding the overall totals, the summary is only trusted when it exists
+TOTAL = "total"
+
+REBUILD_SQL = """
+    INSERT INTO tbl_resumo_contratos (dimensao, chave, contratos, isentos, mrr, clientes)
+    SELECT
+        CASE
+            WHEN GROUPING(st.status) = 0 THEN 'status'
+            WHEN GROUPING(p.descricao) = 0 THEN 'plano'
+            WHEN GROUPING(c.endereco_cidade) = 0 THEN 'cidade'
+            WHEN GROUPING(c.endereco_uf) = 0 THEN 'uf'
+            ELSE 'total'
+        END,
+        CASE
+            WHEN GROUPING(st.status) = 0 THEN st.status
+            WHEN GROUPING(p.descricao) = 0 THEN p.descricao
+            WHEN GROUPING(c.endereco_cidade) = 0 THEN c.endereco_cidade || ' - ' || c.endereco_uf
+            WHEN GROUPING(c.endereco_uf) = 0 THEN c.endereco_uf
+            ELSE ''
+        END,
+        count(*),
+        count(*) FILTER (WHERE c.isento),
+        coalesce(sum(p.valor) FILTER (WHERE NOT c.isento), 0),
+        CASE WHEN GROUPING(c.endereco_cidade) = 0 THEN count(DISTINCT c.cliente_id) END
+    FROM tbl_cliente_contratos c
+    JOIN tbl_planos p ON p.id = c.plano_id
+    JOIN tbl_status_contrato st ON st.id = c.status_id
+    GROUP BY GROUPING SETS ((st.status), (p.descricao), (c.endereco_cidade, c.endereco_uf), (c.endereco_uf), ())
+"""
+
+CITY_CLIENTS_SQL = """
+    UPDATE tbl_resumo_contratos r SET clientes = x.clientes
+    FROM (
+        SELECT endereco_cidade || ' - ' || endereco_uf AS chave, count(DISTINCT cliente_id) AS clientes
+        FROM tbl_cliente_contratos
+        WHERE lower(endereco_cidade) = ANY(%s)
+        GROUP BY endereco_cidade, endereco_uf
+    ) x
+    WHERE r.dimensao = 'cidade' AND r.chave = x.chave
+"""
+
+def city_key(city, uf):
+    return f"{city} - {uf}"
+
+class ContractSummary:
+    """Contracts, exempt contracts and MRR (plan value of the non-exempt contracts) per status,
+    plan, UF and city, plus clients per city, kept in tbl_resumo_contratos so the dashboard
+    reads a few rows instead of scanning the contracts.
+
+    Loaders count the contracts they write or are about to overwrite and apply() folds those
+    deltas in at the end of each load, or invalidate() drops the totals when the load fails.
+    Clients per city isn't additive, it is recounted for the cities touched only"""
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        # (status id, plan id, uf, city, exempt) -> contracts added, negative when removed
+        self.deltas = Counter()
+        self.lock = Lock()
+
+    def add(self, rows, sign=1):
+        """Count contract rows, as given to insert_many, being written (or removed with sign=-1)"""
+        counts = Counter(
+            (row['status'], row['plano'], row['endereco_uf'], row['endereco_cidade'], bool(row['isento']))
+            for row in rows
+        )
+        self.add_counts(counts.items(), sign)
+
+    def add_counts(self, counts, sign=1):
+        # Loaders writing chunks concurrently share the summary
+        with self.lock:
+            for profile, count in counts:
+                self.deltas[tuple(profile)] += sign * count
+
+    def remove(self, contract_ids):
+        """Count stored contracts before they are updated in place or deleted"""
+        fields = (ClienteContrato.status, ClienteContrato.plano, ClienteContrato.endereco_uf,
+                  ClienteContrato.endereco_cidade, ClienteContrato.isento)
+        for batch in chunked(contract_ids, self.batch_size):
+            counts = (ClienteContrato
+                      .select(*fields, fn.COUNT(ClienteContrato.id))
+                      .where(ClienteContrato.id.in_(batch))
+                      .group_by(*fields)
+                      .tuples())
+            self.add_counts(((row[:-1], row[-1]) for row in counts), sign=-1)
+
+    def reset(self):
+        """Zero totals, for a load that starts from empty tables"""
+        with self.lock:
+            self.deltas.clear()
+        with db.atomic():
+            ResumoContrato.delete().execute()
+            ResumoContrato.create(dimensao=TOTAL, chave="")
+
+    def invalidate(self):
+        """Drop the totals after a load that failed once some of its rows were committed, they
+        aren't counted. The next read or load rebuilds the summary from the contracts"""
+        with self.lock:
+            self.deltas.clear()
+        ResumoContrato.delete().where(ResumoContrato.dimensao == TOTAL).execute()
+
+    def rebuild(self):
+        """Recompute everything from the contracts"""
+        with self.lock:
+            self.deltas.clear()
+        with db.atomic():
+            ResumoContrato.delete().execute()
+            db.execute_sql(REBUILD_SQL)
+
+    def apply(self):
+        with self.lock:
+            deltas, self.deltas = {profile: n for profile, n in self.deltas.items() if n}, Counter()
+        if not ResumoContrato.select().where(ResumoContrato.dimensao == TOTAL).exists():
+            # Never built, deltas alone would leave out whatever was already stored
+            self.rebuild()
+            return
+        if not deltas:
+            return
+
+        statuses = dict(StatusContrato.select(StatusContrato.id, StatusContrato.status).tuples())
+        plan_ids = {profile[1] for profile in deltas}
+        plans = {plan.id: plan for plan in Plano.select().where(Plano.id.in_(list(plan_ids)))}
+
+        # (dimensao, chave) -> [contratos, isentos, mrr]
+        rows = defaultdict(lambda: [0, 0, Decimal(0)])
+        for (status_id, plan_id, uf, city, exempt), count in deltas.items():
+            plan = plans[plan_id]
+            keys = (("status", statuses[status_id]), ("plano", plan.descricao), ("uf", uf),
+                    ("cidade", city_key(city, uf)), (TOTAL, ""))
+            for key in keys:
+                row = rows[key]
+                row[0] += count
+                if exempt:
+                    row[1] += count
+                else:
+                    row[2] += count * plan.valor
+
+        data = [
+            {'dimensao': dimension, 'chave': key, 'contratos': contracts, 'isentos': exempt, 'mrr': mrr}
+            for (dimension, key), (contracts, exempt, mrr) in rows.items()
+        ]
+        cities = sorted({profile[3].lower() for profile in deltas})
+        with db.atomic():
+            for batch in chunked(data, self.batch_size):
+                (ResumoContrato
+                 .insert_many(batch)
+                 .on_conflict(
+                     conflict_target=[ResumoContrato.dimensao, ResumoContrato.chave],
+                     update={
+                         ResumoContrato.contratos: ResumoContrato.contratos + EXCLUDED.contratos,
+                         ResumoContrato.isentos: ResumoContrato.isentos + EXCLUDED.isentos,
+                         ResumoContrato.mrr: ResumoContrato.mrr + EXCLUDED.mrr
+                     })
+                 .execute())
+            ResumoContrato.delete().where(
+                (ResumoContrato.contratos <= 0) & (ResumoContrato.dimensao != TOTAL)
+            ).execute()
+            db.execute_sql(CITY_CLIENTS_SQL, (cities,))
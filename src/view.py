@@ -1,8 +1,14 @@
+import time
 from rich.console import Console
 from rich.table import Table
 from rich.panel import Panel
 from rich.box import SIMPLE_HEAVY, ROUNDED, SIMPLE
+from peewee import fn
 from .database import *
+from .summary import TOTAL, ContractSummary
+
+# Rows per printed table when streaming a page of contracts
+VIEW_BLOCK_SIZE = 500
 
 def view_import_summary(stats):
     console = Console()
@@ -18,11 +24,43 @@ def view_import_summary(stats):
     summary_table.add_row("Contacts inserted", str(stats['contacts_inserted']))
     summary_table.add_row("Contracts inserted", str(stats['contracts_inserted']))
     summary_table.add_row("Plans created", str(stats['plans_inserted']))
-    
+
+    # Incremental imports also report what was left untouched or removed
+    incremental_rows = [
+        ("Clients updated", "clients_updated"),
+        ("Clients unchanged", "clients_unchanged"),
+        ("Contracts updated", "contracts_updated"),
+        ("Contracts unchanged", "contracts_unchanged"),
+        ("Contracts deleted", "contracts_deleted")
+    ]
+    for label, key in incremental_rows:
+        if key in stats:
+            summary_table.add_row(label, str(stats[key]))
+
+    for name, counts in stats.get('cache', {}).items():
+        summary_table.add_row(
+            f"{name.replace('_', ' ').capitalize()} cache hits / misses",
+            f"{counts['hits']} / {counts['misses']}"
+        )
+
     console.print(summary_table)
-    
+
+    # Values checked and found invalid by each field rule, and the time it took
+    if stats.get('rules'):
+        rules_table = Table(title="[bold]FIELD RULES[/]", box=SIMPLE_HEAVY)
+        rules_table.add_column("Rule", style="cyan", no_wrap=True)
+        rules_table.add_column("Checked", style="magenta", justify="right")
+        rules_table.add_column("Invalid", style="red", justify="right")
+        rules_table.add_column("Time (ms)", justify="right")
+        for name, counts in stats['rules'].items():
+            rules_table.add_row(
+                name, str(counts['checked']), str(counts['invalid']), f"{counts['seconds'] * 1000:.1f}"
+            )
+        console.print(rules_table)
+
     # Section for unprocessed records
-    total_dropped = sum(len(r) for r in stats['dropped_records'].values())
+    dropped = stats['dropped_records']
+    total_dropped = dropped.total()
     if total_dropped > 0:
         dropped_panel = Panel.fit(
             f"[bold red]{total_dropped} records could not be processed[/]",
@@ -31,11 +69,12 @@ def view_import_summary(stats):
         )
         console.print(dropped_panel)
         
-        for category, records in stats['dropped_records'].items():
-            if records:
-                # Table per error category
+        for category, count in dropped.counts.items():
+            if count:
+                # Table per error category, showing the sampled records
+                records = dropped.samples.get(category, [])
                 error_table = Table(
-                    title=f"[italic]{category.replace('_', ' ').title()} ({len(records)} records)",
+                    title=f"[italic]{category.replace('_', ' ').title()} ({count} records)",
                     box=SIMPLE_HEAVY,
                     show_header=True,
                     header_style="bold yellow"
@@ -44,79 +83,310 @@ def view_import_summary(stats):
                 error_table.add_column("Identifier")
                 error_table.add_column("Reason")
                 
-                for i, record in enumerate(records[:5], 1):
-                    identifier = record['data'].get('CPF/CNPJ', 'Unknown') or \
-                                 record['data'].get('Nome/Razão Social', 'Unknown')
+                for i, record in enumerate(records, 1):
+                    identifier = record.identifier or 'Unknown'
                     error_table.add_row(
                         str(i),
-                        identifier,
-                        record['reason']
+                        str(identifier),
+                        record.reason
                     )
                 
-                if len(records) > 5:
+                if count > len(records):
                     error_table.add_row(
                         "...",
-                        f"[dim]and {len(records)-5} more[/]",
+                        f"[dim]and {count - len(records)} more[/]",
                         ""
                     )
                 
                 console.print(error_table)
 
 
-def view_contracts(limit=20):
+def view_export_summary(stats, out_dir):
     console = Console()
-    
-    # Corrected query with joins in the proper order
-    contracts = (ClienteContrato
-                .select(
-                    ClienteContrato,
-                    Cliente,
-                    Plano,
-                    StatusContrato
-                )
-                .join(Cliente, on=(ClienteContrato.cliente == Cliente.id))
-                .join(Plano, on=(ClienteContrato.plano == Plano.id))
-                .join(StatusContrato, on=(ClienteContrato.status == StatusContrato.id))
-                .limit(limit))
-    
-    # Create table
-    table = Table(
-        title=f"[bold]LAST {limit} CONTRACTS[/]",
-        box=ROUNDED,
-        header_style="bold magenta",
-        show_lines=True
-    )
-    
-    # Columns
-    table.add_column("ID", style="dim", width=8)
-    table.add_column("Client", width=25)
-    table.add_column("CPF/CNPJ", width=18)
-    table.add_column("Plan", width=20)
-    table.add_column("Value", justify="right", width=10)
-    table.add_column("Due Date", justify="center", width=10)
-    table.add_column("Status", width=15)
-    
-    # Add rows
-    for contract in contracts:
+
+    table = Table(title=f"[bold]EXPORT SUMMARY[/] ({out_dir})", box=SIMPLE_HEAVY)
+    table.add_column("Dataset", style="cyan", no_wrap=True)
+    table.add_column("Rows", style="magenta", justify="right")
+    table.add_column("Files", justify="right")
+    table.add_column("Last id", justify="right")
+
+    for name, dataset in stats.items():
+        table.add_row(name, str(dataset['rows']), str(dataset['files']), str(dataset['watermark']))
+
+    console.print(table)
+
+
+def view_profile(report):
+    console = Console()
+
+    table = Table(title="[bold]IMPORT PROFILE[/]", box=SIMPLE_HEAVY, pad_edge=False, collapse_padding=True)
+    table.add_column("Stage", style="cyan", no_wrap=True)
+    for header in ("Calls", "Rows", "Wall s", "CPU s", "Rows/s", "RSS MB", "Queries", "Query s"):
+        table.add_column(header, justify="right", no_wrap=True, style="magenta" if header == "Wall s" else None)
+
+    def number(value, fmt="{:,.3f}"):
+        return "-" if value is None else fmt.format(value)
+
+    for stage in report['stages']:
         table.add_row(
-            str(contract.id),
-            contract.cliente.nome_razao_social[:24] + ("..." if len(contract.cliente.nome_razao_social) > 24 else ""),
-            contract.cliente.cpf_cnpj,
-            contract.plano.descricao[:19] + ("..." if len(contract.plano.descricao) > 19 else ""),
-            f"R$ {contract.plano.valor:.2f}",
-            str(contract.dia_vencimento),
-            contract.status.status
+            stage['stage'],
+            str(stage['calls']),
+            str(stage['rows']) if stage['rows'] else "-",
+            number(stage['wall_s']),
+            number(stage['cpu_s']),
+            number(stage['rows_per_s'], "{:.0f}"),
+            number(stage['peak_rss_mb'], "{:,.1f}"),
+            str(stage['queries']),
+            number(stage['query_s'])
         )
-    
+
+    total = report['total']
+    table.add_section()
+    table.add_row(
+        "[bold]total[/]", "", "",
+        number(total['wall_s']),
+        number(total['cpu_s']),
+        "",
+        number(total['peak_rss_mb'], "{:,.1f}"),
+        str(total['queries']),
+        number(total['query_s'])
+    )
+
     console.print(table)
-    
+
+
+def contracts_query(after_id=None, status=None, plan=None, uf=None, city=None, cpf_cnpj=None):
+    """Contracts ordered by id, optionally after a given id (keyset pagination) and filtered"""
+    query = (ClienteContrato
+             .select(
+                 ClienteContrato.id,
+                 Cliente.nome_razao_social,
+                 Cliente.cpf_cnpj,
+                 Plano.descricao,
+                 Plano.valor,
+                 ClienteContrato.dia_vencimento,
+                 StatusContrato.status
+             )
+             .join(Cliente, on=(ClienteContrato.cliente == Cliente.id))
+             .switch(ClienteContrato)
+             .join(Plano, on=(ClienteContrato.plano == Plano.id))
+             .switch(ClienteContrato)
+             .join(StatusContrato, on=(ClienteContrato.status == StatusContrato.id))
+             .order_by(ClienteContrato.id))
+
+    filters = contract_filters(status, plan, uf, city, cpf_cnpj)
+    if after_id is not None:
+        filters.append(ClienteContrato.id > after_id)
+    return query.where(*filters) if filters else query
+
+def contract_filters(status=None, plan=None, uf=None, city=None, cpf_cnpj=None):
+    filters = []
+    if status:
+        filters.append(ClienteContrato.status.in_(StatusContrato.select(StatusContrato.id).where(
+            fn.LOWER(StatusContrato.status) == status.lower())))
+    if plan:
+        filters.append(ClienteContrato.plano.in_(Plano.select(Plano.id).where(Plano.descricao.ilike(f"%{plan}%"))))
+    if uf:
+        # helpers pulls in pandas, only worth it when filtering
+        from .helpers import state_to_uf
+        filters.append(ClienteContrato.endereco_uf == state_to_uf(uf))
+    if city:
+        filters.append(fn.LOWER(ClienteContrato.endereco_cidade) == city.lower())
+    if cpf_cnpj:
+        import pandas as pd
+        from .helpers import validate_cpf_cnpj
+
+        # Stored in canonical format, accept it typed with or without punctuation
+        valid, canonical = validate_cpf_cnpj(pd.Series([cpf_cnpj]))
+        document = canonical[0] if valid[0] else cpf_cnpj
+        filters.append(ClienteContrato.cliente.in_(Cliente.select(Cliente.id).where(Cliente.cpf_cnpj == document)))
+    return filters
+
+def iter_server_side(query, itersize=2000, name="view_contracts"):
+    """Rows of query fetched itersize at a time through a named (server-side) cursor"""
+    sql, params = query.sql()
+    # Named cursors only live inside a transaction, and peewee runs its connections in autocommit
+    conn = db.connection()
+    autocommit, conn.autocommit = conn.autocommit, False
+    try:
+        with conn.cursor(name=name) as cursor:
+            cursor.itersize = itersize
+            cursor.execute(sql, params)
+            yield from cursor
+    finally:
+        conn.rollback()
+        conn.autocommit = autocommit
+
+def contract_counts(exact=False, **filters):
+    """Total and exempt contracts. Unless exact counts are asked for, the unfiltered totals
+    come from the contract summary, or the planner statistics before it is built, instead of
+    scanning the table"""
+    if not exact and not any(filters.values()):
+        total = ResumoContrato.get_or_none(ResumoContrato.dimensao == TOTAL)
+        if total is not None:
+            return total.contratos, total.isentos, False
+        estimate = db.execute_sql(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = 'tbl_cliente_contratos'::regclass"
+        ).fetchone()[0]
+        # -1 (or 0 on older servers) until the table is first analyzed
+        if estimate > 0:
+            exempt = db.execute_sql("""
+                SELECT freq FROM pg_stats,
+                     unnest(most_common_vals::text::boolean[], most_common_freqs) AS mcv(value, freq)
+                WHERE tablename = 'tbl_cliente_contratos' AND attname = 'isento' AND value
+            """).fetchone()
+            return estimate, round(estimate * exempt[0]) if exempt else 0, True
+
+    query = ClienteContrato.select(
+        fn.COUNT(ClienteContrato.id),
+        fn.COUNT(ClienteContrato.id).filter(ClienteContrato.isento == True)
+    )
+    conditions = contract_filters(**filters)
+    if conditions:
+        query = query.where(*conditions)
+    total, exempt = query.tuples().get()
+    return total, exempt, False
+
+def view_contracts(page_size=20, after_id=None, exact_counts=False, **filters):
+    console = Console()
+
+    def page_table(title=None):
+        table = Table(
+            title=title,
+            box=ROUNDED,
+            header_style="bold magenta",
+            show_header=title is not None,
+            show_lines=True
+        )
+
+        # Columns
+        table.add_column("ID", style="dim", width=8)
+        table.add_column("Client", width=25)
+        table.add_column("CPF/CNPJ", width=18)
+        table.add_column("Plan", width=20)
+        table.add_column("Value", justify="right", width=10)
+        table.add_column("Due Date", justify="center", width=10)
+        table.add_column("Status", width=15)
+        return table
+
+    # Rows are printed in blocks, so a big page never sits in memory as a whole
+    query = contracts_query(after_id, **filters).limit(page_size)
+    table = page_table(f"[bold]CONTRACTS[/] (after id {after_id or 0}, up to {page_size})")
+    shown, last_id = 0, None
+    for contract_id, nome, cpf_cnpj, plano, valor, vencimento, status in iter_server_side(query):
+        table.add_row(
+            str(contract_id),
+            nome[:24] + ("..." if len(nome) > 24 else ""),
+            cpf_cnpj,
+            plano[:19] + ("..." if len(plano) > 19 else ""),
+            f"R$ {valor:.2f}",
+            str(vencimento),
+            status
+        )
+        shown += 1
+        last_id = contract_id
+        if shown % VIEW_BLOCK_SIZE == 0:
+            console.print(table)
+            table = page_table()
+    if table.row_count or not shown:
+        console.print(table)
+
+    if shown == page_size:
+        console.print(f"[dim]Next page: --after-id {last_id}[/]")
+
     # Statistical summary
+    total, exempt, approximate = contract_counts(exact_counts, **filters)
+    prefix = "~" if approximate else ""
+    scope = "matching the filters" if any(filters.values()) else "in database"
+
     stats_table = Table(box=SIMPLE, width=80)
     stats_table.add_column("Statistic", style="cyan")
     stats_table.add_column("Value", style="green", justify="right")
-    
-    total_contracts = ClienteContrato.select().count()
-    stats_table.add_row("Total contracts in database", str(total_contracts))
-    stats_table.add_row("Exempt contracts", str(ClienteContrato.select().where(ClienteContrato.isento == True).count()))
-    
-    console.print(stats_table)
\ No newline at end of file
+
+    stats_table.add_row(f"Total contracts {scope}", f"{prefix}{total}")
+    stats_table.add_row("Exempt contracts", f"{prefix}{exempt}")
+    if approximate:
+        stats_table.add_row("[dim]Estimated from planner statistics, --exact-counts to count[/]", "")
+
+    console.print(stats_table)
+
+def view_dashboard(refresh=False, top_cities=15):
+    """Contract aggregates read from tbl_resumo_contratos, a handful of rows whatever the
+    number of contracts. refresh recomputes them from the contracts first"""
+    console = Console()
+    if refresh or not ResumoContrato.select().where(ResumoContrato.dimensao == TOTAL).exists():
+        ContractSummary().rebuild()
+
+    dimensions = {}
+    for row in (ResumoContrato
+                .select()
+                .where(ResumoContrato.dimensao != "cidade")
+                .order_by(ResumoContrato.contratos.desc(), ResumoContrato.chave)):
+        dimensions.setdefault(row.dimensao, []).append(row)
+    cities = (ResumoContrato
+              .select()
+              .where(ResumoContrato.dimensao == "cidade")
+              .order_by(ResumoContrato.clientes.desc(), ResumoContrato.chave)
+              .limit(top_cities))
+    city_count = ResumoContrato.select().where(ResumoContrato.dimensao == "cidade").count()
+
+    total = dimensions[TOTAL][0]
+    totals_table = Table(title="[bold]CONTRACTS DASHBOARD[/]", box=SIMPLE_HEAVY)
+    totals_table.add_column("Metric", style="cyan", no_wrap=True)
+    totals_table.add_column("Value", style="magenta", justify="right")
+    totals_table.add_row("Contracts", str(total.contratos))
+    totals_table.add_row("Exempt contracts", str(total.isentos))
+    totals_table.add_row("MRR (non-exempt plan values)", f"R$ {total.mrr:,.2f}")
+    totals_table.add_row("Cities", str(city_count))
+    console.print(totals_table)
+
+    for dimension, title in (("status", "Status"), ("plano", "Plan"), ("uf", "UF")):
+        table = Table(title=f"[bold]BY {title.upper()}[/]", box=SIMPLE_HEAVY)
+        table.add_column(title, style="cyan")
+        table.add_column("Contracts", justify="right")
+        table.add_column("Exempt", justify="right")
+        table.add_column("MRR", style="green", justify="right")
+        for row in dimensions.get(dimension, []):
+            table.add_row(row.chave, str(row.contratos), str(row.isentos), f"R$ {row.mrr:,.2f}")
+        console.print(table)
+
+    table = Table(title=f"[bold]CLIENTS PER CITY[/] (top {top_cities} of {city_count})", box=SIMPLE_HEAVY)
+    table.add_column("City", style="cyan")
+    table.add_column("Clients", style="magenta", justify="right")
+    table.add_column("Contracts", justify="right")
+    for row in cities:
+        table.add_row(row.chave, str(row.clientes), str(row.contratos))
+    console.print(table)
+
+def view_search(query, limit=20):
+    """Clients matching query, best first, each one with its contacts and contracts"""
+    from .search import search_clients
+
+    console = Console()
+    start = time.perf_counter()
+    results = search_clients(query, limit)
+    elapsed = (time.perf_counter() - start) * 1000
+
+    table = Table(
+        title=f"[bold]CLIENTS MATCHING[/] [italic]{query}[/]",
+        box=ROUNDED,
+        header_style="bold magenta",
+        show_lines=True
+    )
+    table.add_column("Score", justify="right", style="dim")
+    table.add_column("Client", style="cyan")
+    table.add_column("CPF/CNPJ", no_wrap=True)
+    table.add_column("Contacts")
+    table.add_column("Contracts")
+    for result in results:
+        client = result["nome_razao_social"]
+        if result["nome_fantasia"]:
+            client += f"\n[dim]{result['nome_fantasia']}[/]"
+        contacts = "\n".join(f"{c['tipo']}: {c['contato']}" for c in result["contatos"])
+        contracts = "\n".join(
+            f"#{c['id']} {c['plano']} ({c['status']}), {c['cidade']} - {c['uf']}" for c in result["contratos"]
+        )
+        table.add_row(f"{result['score']:.2f}", client, result["cpf_cnpj"], contacts, contracts)
+
+    console.print(table)
+    console.print(f"[dim]{len(results)} clients in {elapsed:.1f} ms[/]")
@@ -0,0 +1,36 @@
+import os
+from pathlib import Path
+
+SHEET_SUFFIXES = (".xlsx", ".csv", ".parquet")
+
+class DirectoryWatcher:
+    """Polls a directory for sheets. A file is only reported once its size and modification
+    time stayed the same between two polls, so files still being copied in are left alone,
+    and reported again whenever it changes afterwards"""
+
+    def __init__(self, directory, suffixes=SHEET_SUFFIXES):
+        self.directory = Path(directory)
+        self.suffixes = suffixes
+        # path -> (size, mtime) on the previous poll, and when it was last reported
+        self.seen = {}
+        self.reported = {}
+
+    def poll(self):
+        """Paths that became ready since the last call, oldest first"""
+        current = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                # Hidden files and office lock files (~$sheet.xlsx) are never sheets
+                if entry.name.startswith((".", "~$")) or not entry.is_file():
+                    continue
+                if Path(entry.name).suffix.lower() in self.suffixes:
+                    stat = entry.stat()
+                    current[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        ready = [path for path, signature in current.items()
+                 if self.seen.get(path) == signature and self.reported.get(path) != signature]
+        self.seen = current
+        self.reported = {path: signature for path, signature in self.reported.items() if path in current}
+        for path in ready:
+            self.reported[path] = current[path]
+        return sorted(ready, key=lambda path: current[path][1])
@@ -0,0 +1,47 @@
+import csv
+import os
+
+def require_pyarrow(purpose):
+    """pyarrow and pyarrow.parquet, or an ImportError saying what purpose needs them"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(f"{purpose} requires pyarrow (pip install -r requirements-parquet.txt)") from e
+    return pyarrow, pyarrow.parquet
+
+def open_writer(fmt, path, columns):
+    """Writer appending DataFrames with the (name, type) columns to a csv or parquet file"""
+    return ParquetPartWriter(path, columns) if fmt == "parquet" else CsvPartWriter(path, columns)
+
+class CsvPartWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        # The header goes first, a file nothing gets written to still has its columns
+        csv.writer(self.file, lineterminator=os.linesep).writerow(name for name, _ in columns)
+
+    def write(self, df):
+        df.to_csv(self.file, index=False, header=False)
+
+    def close(self):
+        self.file.close()
+
+class ParquetPartWriter:
+    """Every batch becomes a row group of the same file"""
+
+    def __init__(self, path, columns):
+        pa, pq = require_pyarrow("Writing parquet")
+        types = {
+            "int64": pa.int64(), "string": pa.string(), "date": pa.date32(),
+            "timestamp": pa.timestamp("us"), "bool": pa.bool_(), "decimal": pa.decimal128(15, 2)
+        }
+        # Explicit schema, a batch where a nullable column is all empty can't be inferred
+        self.schema = pa.schema([(name, types[kind]) for name, kind in columns])
+        self.table = pa.Table
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, df):
+        self.writer.write_table(self.table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+from src.helpers import validate_cpf_cnpj
+from src.rules import FieldRules, check_cep
+
+def test_check_cep_formats_eight_digits():
+    ceps, valid = check_cep(pd.Series(["01310-100", "30130010", " 30130-010 "]))
+    assert ceps.tolist() == ["01310-100", "30130-010", "30130-010"]
+    assert valid.tolist() == [True, True, True]
+
+def test_check_cep_restores_the_leading_zero_of_numbers():
+    ceps, valid = check_cep(pd.Series([1310100.0, 30130010.0]))
+    assert ceps.tolist() == ["01310-100", "30130-010"]
+    assert valid.tolist() == [True, True]
+
+    ceps, valid = check_cep(pd.Series(["1310100", 1310100], dtype=object))
+    assert ceps.tolist() == ["01310-100", "01310-100"]
+    assert valid.all()
+
+@pytest.mark.parametrize("cep", ["", "n/a", "1", "123119", "013101000", "CEP"])
+def test_check_cep_rejects_empty_short_and_long_values(cep):
+    _, valid = check_cep(pd.Series([cep]))
+    assert not valid.iloc[0]
+
+def test_validate_cpf_cnpj_canonical_format():
+    values = pd.Series(["529.982.247-25", "52998224725", "11.222.333/0001-81", "11222333000181"])
+    valid, canonical = validate_cpf_cnpj(values)
+    assert valid.tolist() == [True, True, True, True]
+    assert canonical.tolist() == ["529.982.247-25", "529.982.247-25", "11.222.333/0001-81", "11.222.333/0001-81"]
+
+def test_validate_cpf_cnpj_rejects_wrong_check_digits_repeats_and_lengths():
+    values = pd.Series(["529.982.247-24", "111.111.111-11", "11.222.333/0001-80", "1234", "", "abc"])
+    valid, canonical = validate_cpf_cnpj(values)
+    assert not any(valid)
+    # Invalid values are kept as they were given
+    assert canonical.tolist() == values.tolist()
+
+def test_field_rules_reject_and_clear():
+    df = pd.DataFrame({
+        "CEP": ["01310-100", "123", None],
+        "Emails": ["Ana.Souza@Example.com", "bad", "ok@example.com"]
+    })
+    rules = FieldRules([
+        {"column": "CEP", "check": "cep", "on_invalid": "reject"},
+        {"column": "Emails", "check": "email", "on_invalid": "clear"}
+    ])
+    kept, rejections = rules.apply(df)
+
+    # Empty values are left to the required columns check
+    assert kept.index.tolist() == [0, 2]
+    assert kept.loc[0, "CEP"] == "01310-100"
+    assert pd.isna(kept.loc[2, "CEP"])
+    assert [(reason, rows.index.tolist()) for reason, rows in rejections] == [("Invalid value: CEP", [1])]
+    assert df["Emails"].tolist() == ["Ana.Souza@Example.com", None, "ok@example.com"]
+    assert rules.stats["CEP: cep"]["checked"] == 2
+    assert rules.stats["CEP: cep"]["invalid"] == 1
+    assert rules.stats["Emails: email"]["invalid"] == 1
+
+def test_field_rules_count_each_row_under_its_first_failed_rule():
+    df = pd.DataFrame({"CEP": ["1", "01310-100"], "Vencimento": [40, 50]})
+    rules = FieldRules([
+        {"column": "CEP", "check": "cep"},
+        {"column": "Vencimento", "check": "integer", "min": 1, "max": 31}
+    ])
+    kept, rejections = rules.apply(df)
+    assert kept.empty
+    assert [(reason, rows.index.tolist()) for reason, rows in rejections] == [
+        ("Invalid value: CEP", [0]), ("Invalid value: Vencimento", [1])
+    ]
+
+def test_field_rules_refuse_unknown_checks():
+    with pytest.raises(ValueError, match="Unknown check"):
+        FieldRules([{"column": "CEP", "check": "zip"}])
+    with pytest.raises(ValueError, match="on_invalid"):
+        FieldRules([{"column": "CEP", "check": "cep", "on_invalid": "drop"}])